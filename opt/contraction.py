@@ -1,12 +1,14 @@
 import functools
+import math
 
 import networkx as nx
+import numpy as np
 import operator as op
 
 from collections import deque
 
 
-class ContractionTree(nx.Graph):
+class ContractionTree:
     """Representation of a contraction tree.
 
     Incrementally builds a contraction tree through repeated edge
@@ -15,29 +17,34 @@ class ContractionTree(nx.Graph):
     minimum-weighted edge is then split to create a rooted
     contraction tree with locally optimal Ctime complexity.
 
-    The ContractionTree class subclasses a NetworkX graph because
-    it is itself a graph-like representation which utilizes
-    various NetworkX functions for convenience.
+    Tree nodes are integer ids into arrays: the leaves 0..|V|-1 are the
+    vertices of the graph, in the order of graph.nodes(), the internal
+    nodes follow in the order they are made, and the root made by
+    reroot() comes last. The bag of vertices a tree node stands for is
+    not stored; once the tree is set, see _set_tree(), the leaves of
+    every subtree are a range of leaf_order, see bag().
 
     Attributes:
         graph : the graph whose contraction is described 
             by the contraction tree
 
-        tree_nodes: a list of nodes in the tree. Each
-            node is a bag of vertices, i.e. a set of ints
+        vertices: the vertices of the graph, by leaf id
 
-        tree_node_dict: a mapping from a node v in G to a
-            set of vertices that have been merged into v,
-            a.k.a. a tree node
+        vertex_id: a mapping from a vertex of the graph to its leaf id
 
-        history: a mapping from a tree node in the contraction tree to the
-            edge in G that was contracted to create the tree node
+        tree_nodes: a list of the internal nodes in the tree,
+            in the order they were made
 
-        edge_cuts: a mapping from a tree node to the edges
-            incident to the node in G created via the contraction
+        tree_node: an array mapping the leaf id of a node v in G
+            to the tree node of the vertices merged into v
 
-        cs: a mapping from a tree node to the Cspace required to
-            make the tree node, based on child node Cspace
+        history: a list mapping a tree node to the edge in G that was
+            contracted to create the tree node, None for leaves
+
+        cs: an array mapping a tree node to the Cspace required to
+            make the tree node, the cutweight of its bag in G
+
+        size: an array mapping a tree node to the number of vertices in its bag
 
         argmin_tree_node_cut: an integer representing the smallest edge cut
             encountered thus far (over a series of contractions). This
@@ -47,56 +54,62 @@ class ContractionTree(nx.Graph):
         argmin_tree_node: the edge to re-root a contraction tree such that
             Ctime is locally optimal
 
-        left_child: a mapping from tree node parent to tree node left child
+        left_child: an array mapping a tree node to its left child, -1 for leaves
 
-        right_child: a mapping tree node parent to tree node right child
+        right_child: an array mapping a tree node to its right child, -1 for leaves
 
-        parent: a mapping from tree node child to tree node parent
+        parent: an array mapping a tree node to its parent, -1 for the root
 
         current_root: a tree node representing the root of a rooted
             contraction tree.
 
+        leaf_order: once the tree is set, the leaf ids in depth-first order
+
+        leaf_range: once the tree is set, a (2|V|, 2) array of the range of
+            leaf_order holding the leaves under each tree node
     """
 
-    def __init__(self, G, *args, **kwargs):
-        super(ContractionTree, self).__init__(*args, **kwargs)
+    def __init__(self, G):
         self.graph = G
-        self.tree_nodes = []
 
-        # a mapping from a node v in G to a set of vertices
-        # that have been merged into v. the set is a tree node
-        self.tree_node_dict = {}
+        self.vertices = list(G.nodes())
+        self.vertex_id = {v: i for i, v in enumerate(self.vertices)}
 
-        # a mapping from a tree node to an edge in G
-        # marking what was contracted to achieve the node
-        self.history = {}
+        # |V| leaves, |V|-1 contractions and the root made by reroot()
+        n = len(self.vertices)
+        capacity = 2 * n
 
-        # a mapping from a tree node to the edges incident to
-        # the new node in G, the node resulting from the contraction
-        self.edge_cuts = {}
+        self.tree_nodes = []
+        self.tree_node = np.arange(n)
+        self.history = [None] * capacity
+        self.cs = np.zeros(capacity)
+        self.size = np.zeros(capacity, dtype=int)
 
-        # a mapping from a tree node to the cutweight of the
-        # contraction tree edge "parent" induced by the tree node's creation
-        self.cs = {}
+        self.left_child = np.full(capacity, -1)
+        self.right_child = np.full(capacity, -1)
+        self.parent = np.full(capacity, -1)
 
         # the smallest edge cut encountered
         self.argmin_tree_node_cut = None
         # the tree node with the smallest edge cut
         self.argmin_tree_node = None
 
-        # a mapping from tree node to left child tree node
-        self.left_child = {}
-        # a mapping from tree node to right child tree node
-        self.right_child = {}
-        # a mapping from tree node to parent tree node (if one exists)
-        self.parent = {}
         # the current root of a rooted contraction tree
         self.current_root = None
 
+        self.leaf_order = None
+        self.leaf_range = None
+
+        # the next tree node id
+        self._next = n
+
+        # the weights of the edges between the bags of the tree nodes
+        # at the top of the tree, by leaf id of their vertex in the minor
+        self._cuts = {i: {} for i in range(n)}
+
         # set initial values for edge cuts and tree nodes and Cspace values
         self._init_leaves()
 
-
     def _init_leaves(self):
         """Initializes contraction tree meta-data.
     
@@ -106,48 +119,28 @@ class ContractionTree(nx.Graph):
         which correspond to the nodes in self.graph
         """
 
-        for v in self.graph.nodes():
-            if v not in self.tree_node_dict:
-                # initialize the tree node
-                tree_node = frozenset([v])
-                # associate v with the tree node only consisting of v
-                self.tree_node_dict[v] = tree_node
-
-                # set the initial edge set, dependent on all edges in G
-                # incident to node v
-                self.edge_cuts[tree_node] = {
-                    e for e in map(
-                        lambda edge: tuple(sorted(edge)), self.graph.edges([v])
-                    )
-                }
-
-                # set the initial cutweight
-                cs = sum(self.graph[u][v]["weight"] for u,v in self.edge_cuts[tree_node])
-
-                # set the initial edge Cspace for the tree node, dependent
-                # on the cutweights of all edges incident to node v
-                self.cs[tree_node] = cs
-
-                # keep track of Cspace associated with each tensor
-                if self.argmin_tree_node is None or cs < self.argmin_tree_node_cut:
-                    self.argmin_tree_node = tree_node
-                    self.argmin_tree_node_cut = cs
-
-
-    def _fuse(self, u, v):
-        """Creates a new tree node.
-        
-        Creates a new tree node by unioning the node bags each
-        tree node being contracted represents and updates the
-        current root of the rooted contraction tree
-        """
-        fused = self._treenode(u).union(self._treenode(v))
-        self.current_root = fused
-        return fused
-
-    def _treenode(self, v):
-        """Gets the tree node associated with a node v in a graph."""
-        return self.tree_node_dict[v]
+        for u, v, w in self.graph.edges(data="weight"):
+            i, j = self.vertex_id[u], self.vertex_id[v]
+            self._cuts[i][j] = w
+            self._cuts[j][i] = w
+
+        for leaf in range(len(self.vertices)):
+            # set the initial Cspace for the tree node, dependent
+            # on the cutweights of all edges incident to node v
+            cs = sum(self._cuts[leaf].values())
+            self.cs[leaf] = cs
+            self.size[leaf] = 1
+
+            # keep track of Cspace associated with each tensor
+            if self.argmin_tree_node is None or cs < self.argmin_tree_node_cut:
+                self.argmin_tree_node = leaf
+                self.argmin_tree_node_cut = cs
+
+    def _new_node(self):
+        """Allocates the id of a new tree node"""
+        node = self._next
+        self._next += 1
+        return node
 
     def _enumerated_edges(self, G):
         """Generates a contraction sequence, ordered by descending edge weight."""
@@ -169,22 +162,27 @@ class ContractionTree(nx.Graph):
     def contract(self, u, v):
         """Add a contraction to the contraction tree."""
 
-        # the new tree node is the union of the two child tree nodes
-        new_node = self._fuse(u, v)
+        i, j = self.vertex_id[u], self.vertex_id[v]
+        left, right = self.tree_node[i], self.tree_node[j]
 
-        self.add_edge(self._treenode(u), new_node)
-        self.add_edge(self._treenode(v), new_node)
+        # the new tree node is the union of the two child tree nodes
+        new_node = self._new_node()
+        self.left_child[new_node] = left
+        self.right_child[new_node] = right
+        self.parent[left] = self.parent[right] = new_node
+        self.size[new_node] = self.size[left] + self.size[right]
+        self.current_root = new_node
 
         # set the weight of the 'parent' edge of the new_node
-        self._set_edge_cut(new_node, u, v)
+        self._set_edge_cut(new_node, i, j)
 
         # update the tree node of node being contracted into,
         # to keep track of fused nodes
-        self._set_treenode(u, new_node)
+        self.tree_node[i] = new_node
 
         # keep track of the edge that was contracted
         # to create this tree node
-        self._set_history(new_node, (u, v))
+        self.history[new_node] = (u, v)
 
         # add the new node to the list of tree nodes
         # to be used in determining an order
@@ -194,62 +192,82 @@ class ContractionTree(nx.Graph):
         """Remove substitute one node in an edge list for another"""
         return list(map(lambda e: _overwrite_edge(e, eu, ev), edges))
 
-    def _propagated_cut(self, node1, node2):
-        """Calculate edges remaining from a pairwise node contraction"""
-        return self.edge_cuts[node1].symmetric_difference(self.edge_cuts[node2])
-
     def reroot(self):
-        """Replace the old root in a rooted contraction tree with a new one"""
-        root = self._root(self.argmin_tree_node)
-        self._unroot()
-        return root
-
-    def _root(self, argmin, root="root"):
-        """Root a free contraction tree."""
-
-        # get the parent node (which is the largest vertex bag)
-        parent = max(self.neighbors(argmin))
+        """Replace the old root in a rooted contraction tree with a new one
+
+        Roots the tree on the edge above the argmin tree node, as if the
+        old root were removed and its two children joined, leaving every
+        tree node's children in the order they were contracted in, except
+        on the path from the argmin up to the old root, which turns over:
+        each node on it keeps the child off the path on the left and takes
+        the next node up, or the old root's other child, on the right.
+        """
 
-        # remove the edge between the child and parent
-        self.remove_edge(argmin, parent)
+        argmin, root = self.argmin_tree_node, self._new_node()
+        left, right, parent = self.left_child, self.right_child, self.parent
+        old_root = self.current_root
 
-        # create a new root by creating edges between the
-        # new node, the argmin, and the parent of the argmin
-        self.add_edge(root, parent)
-        self.add_edge(root, argmin)
+        def sibling(node):
+            p = parent[node]
+            return right[p] if left[p] == node else left[p]
 
-        # edge cutset of root, (if the final contraction, should be a null set)
-        cut = self._propagated_cut(parent, argmin)
+        # Cspace of root, the cut of the argmin's sibling
+        self.cs[root] = self.cs[sibling(argmin)]
+        self.size[root] = len(self.vertices)
 
-        # Cspace of root
-        cutweight = sum(map(lambda e: self.graph[e[0]][e[1]]["weight"], cut))
-        self.cs[root] = cutweight
+        # the path from the argmin's parent up to the old root, exclusive
+        path = []
+        node = parent[argmin]
+        while node != old_root:
+            path.append(node)
+            node = parent[node]
 
-        return root
+        if not path:
+            children = (argmin, sibling(argmin))
+        else:
+            children = (path[0], argmin)
 
-    def _unroot(self, root=None):
-        """Find and remove the current root of the tree."""
+            turned = []
+            for below, node, above in zip([argmin] + path, path, path[1:] + [old_root]):
+                up = above if above != old_root else sibling(node)
+                turned.append((node, sibling(below), up))
 
-        # find the current root
-        if root is None:
-            root = self._find_root()
+            for node, off, up in turned:
+                left[node], right[node] = off, up
+                parent[up] = node
 
-        # get the tree nodes incident to that root (i.e. the children)
-        children = list(self.neighbors(root))
-        assert len(children) == 2
+        left[root], right[root] = children
+        for child in children:
+            parent[child] = root
+        parent[root] = -1
 
-        left, right = children
+        # drop the old root
+        left[old_root] = right[old_root] = parent[old_root] = -1
+        self.current_root = root
 
-        # create a free contraction tree by
-        # creating an edge between the children
-        self.add_edge(left, right)
+        # the sizes of the nodes whose bags changed
+        self._set_sizes(root)
 
-        # and removing the old root from the contraction tree
-        self.remove_node(root)
+        return root
 
-    def _find_root(self):
-        """Retrieves the current root of the contraction tree"""
-        return self.current_root
+    def _set_sizes(self, root):
+        """Sets the size of every tree node under root, from its leaves"""
+        for node in reversed(self._preorder(root)):
+            if self.left_child[node] >= 0:
+                self.size[node] = self.size[self.left_child[node]] + self.size[self.right_child[node]]
+
+    def _preorder(self, root):
+        """The tree nodes under root, parents before children, left before right"""
+        order = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            if self.left_child[node] >= 0:
+                stack.append(self.right_child[node])
+                stack.append(self.left_child[node])
+
+        return order
 
     def contract_remaining(self, G):
         """Contracts the final 3 edges of the graph to finish the contraction tree"""
@@ -262,9 +280,6 @@ class ContractionTree(nx.Graph):
         # this is the graph to contract
         minor = G.copy()
 
-        # set meta-data of contraction tree
-        self._init_leaves()
-
         # until there is one node in the graph left, 
         # contract edges by weight descending
         while len(minor) > 1:
@@ -277,7 +292,6 @@ class ContractionTree(nx.Graph):
 
             self.contract(eu,ev)
 
-
     def ordering(self, memory_conscious=True):
         """Generates a contraction sequence.
 
@@ -286,7 +300,7 @@ class ContractionTree(nx.Graph):
         """
 
         if memory_conscious:
-            _, _, ordering, _ = self._memory_ordering("root")
+            _, _, ordering, _ = self._memory_ordering(self.current_root)
             return ordering
         else:
             return map(lambda node: self.history[node], self.tree_nodes)
@@ -300,109 +314,114 @@ class ContractionTree(nx.Graph):
     def _memory_ordering(self, root):
         """Generate a sequence in a memory-conscious manner
 
-        Recursively chooses which sub-tree to contract first
-        based on memory requirements. Constructs sequence in
-        a bottom-up manner.
+        Chooses which sub-tree to contract first based on memory
+        requirements, bottom-up, then lists the contractions with the
+        chosen sub-tree of every node first.
+
+        Returns the Cspace and the peak Cspace of the tree under root,
+        the sequence, and the vertex the sequence contracts it into.
         """
 
-        # if 'root' is a leaf node, the sequence is a singleton list
-        if self.left_child[root] is None and self.right_child[root] is None:
-            u, = root
-            return (self.cs[root], self.cs[root], [], u)
+        cs = self.cs.tolist()
+        left, right = self.left_child.tolist(), self.right_child.tolist()
 
-        # if 'root' has children
-        elif self.left_child[root] is not None and self.right_child[root] is not None:
-            # find the memory-ordering of the left and right children
-            leftcs, leftCs, left_order, u = self._memory_ordering(self.left_child[root])
-            rightcs, rightCs, right_order, v = self._memory_ordering(self.right_child[root])
+        # the peak Cspace of contracting each sub-tree, and the vertex it ends in
+        peak, vertex, left_first = {}, {}, {}
+
+        for node in reversed(self._preorder(root)):
+            l, r = left[node], right[node]
+
+            # if 'node' is a leaf node, the sequence is empty
+            if l < 0:
+                assert r < 0, "Internal nodes should always have 0 or 2 children"
+                peak[node] = cs[node]
+                vertex[node] = self.vertices[node]
+                continue
 
             # calculate the cumulative Cs of each sequence
-            left_score = leftcs + rightCs
-            right_score = rightcs + leftCs
+            left_score = cs[l] + peak[r]
+            right_score = cs[r] + peak[l]
+
+            # process the left subsequence first if it needs less
+            left_first[node] = left_score < right_score
+            peak[node] = max(cs[node], min(left_score, right_score))
+            vertex[node] = vertex[l]
 
-            history = [(u, v)]
+        ordering = []
+        stack = [(root, False)]
+        while stack:
+            node, children_done = stack.pop()
+            l, r = left[node], right[node]
 
-            if left_score < right_score:
-                # process the left subsequence first
-                order = left_order + right_order + history
-                cs = self.cs[root]
-                return (cs, max(cs, left_score), order, u)
+            if l < 0:
+                continue
+
+            if children_done:
+                ordering.append((vertex[l], vertex[r]))
             else:
-                # process the right subsequence first
-                order = right_order + left_order + history
-                cs = self.cs[root]
-                return (cs, max(cs, right_score), order, u)
+                first, second = (l, r) if left_first[node] else (r, l)
+                stack.append((node, True))
+                stack.append((second, False))
+                stack.append((first, False))
 
-        else:
-            raise Exception("Internal nodes should always have 0 or 2 children")
+        return cs[root], peak[root], ordering, vertex[root]
+
+    def _set_edge_cut(self, parent, i, j):
+        """Sets the cutweight of the tree node made by contracting the vertices i, j
 
-    def _set_edge_cut(self, parent, u, v):
-        """Sets edge-related data regarding contraction"""
+        The bags of i and j are merged in the weights of the edges between bags.
+        """
+
+        cut_i, cut_j = self._cuts[i], self._cuts.pop(j)
+        cut_i.pop(j, None)
+
+        for x, w in cut_j.items():
+            if x == i:
+                continue
 
-        # edge set is the symmetric difference of the edge set of both child nodes
-        cut = self._propagated_cut(self._treenode(u), self._treenode(v))
-        self.edge_cuts[parent] = cut
+            cut_x = self._cuts[x]
+            del cut_x[j]
+            cut_x[i] = cut_i[x] = cut_i.get(x, 0) + w
 
         # cutweight (cs) is the sum of the adjacent edge weights
-        cutweight = sum(map(lambda e: self.graph[e[0]][e[1]]["weight"], cut))
+        cutweight = sum(cut_i.values())
         self.cs[parent] = cutweight
 
         # if this isn't the last contraction and
         # this cost is smaller than the smallest cost
-        if len(parent) < len(self.graph) and (
+        if self.size[parent] < len(self.vertices) and (
             self.argmin_tree_node is None or cutweight < self.argmin_tree_node_cut
         ):  # set the new best tree node
             self.argmin_tree_node = parent
             self.argmin_tree_node_cut = cutweight
 
-        return cut
-
+        return cutweight
 
     def _set_tree(self, root):
-        """Does a BFS of the tree to identify parent/child nodes"""
-
-        queue = []
-        seen = set()
-
-        # start at the root
-        queue.append(root)
-
-        while queue:
-            # get the next node
-            node = queue.pop(0)
-            seen.add(node)
-
-            # add all of the children to the queue
-            children = []
-            for neighbor in self.neighbors(node):
-                if neighbor not in seen:
-                    children.append(neighbor)
-                    queue.append(neighbor)
-
-            # make sure this is, in fact, binary tree-like
-            assert len(children) == 2 or len(children) == 0
-
-            # if this is not a leaf node
-            if len(children) == 2:
-                # note parent and child relationships
-                left, right = children
-                self.left_child[node] = left
-                self.right_child[node] = right
-                self.parent[right] = node
-                self.parent[left] = node
-
-            # if this is a leaf node
-            else:
-                # node child relationships
-                self.left_child[node] = None
-                self.right_child[node] = None
+        """Lays out the leaves of the tree depth first, see bag()"""
+
+        self.current_root = root
+        self.leaf_range = np.zeros((len(self.cs), 2), dtype=int)
 
-    def _set_treenode(self, v, tree_node):
-        self.tree_node_dict[v] = tree_node
+        order = self._preorder(root)
+        leaves = [node for node in order if self.left_child[node] < 0]
+        position = {leaf: i for i, leaf in enumerate(leaves)}
 
-    def _set_history(self, tree_node, edge):
-        self.history[tree_node] = edge
+        for node in reversed(order):
+            if self.left_child[node] < 0:
+                self.leaf_range[node] = position[node], position[node] + 1
+            else:
+                self.leaf_range[node] = (
+                    self.leaf_range[self.left_child[node], 0],
+                    self.leaf_range[self.right_child[node], 1],
+                )
+
+        self.leaf_order = np.array(leaves, dtype=int)
 
+    def bag(self, node):
+        """The vertices of G under a tree node, once the tree is set"""
+        start, end = self.leaf_range[node]
+        return frozenset(self.vertices[leaf] for leaf in self.leaf_order[start:end])
 
 
 def cost(G, edges):
@@ -422,6 +441,30 @@ def cost(G, edges):
         op.mul, map(lambda e: e[2]["weight"], G.edges(nbunch=edges, data=True)), 1
     )
 
+def log_cost(G, edges):
+    """The log2 of the cost of contracting two nodes, see cost()
+
+    Assumes that the logarithm of the graph has been taken, so that
+    the log2 weights are summed rather than multiplied.
+
+    Arguments:
+
+        G: the input networkx graph, to query edge weights
+
+        edges: the set of edges to query and sum cutweights
+    """
+    return sum(w for _, _, w in G.edges(nbunch=edges, data="weight"))
+
+
+def _log2_add(x, y):
+    """log2(2**x + 2**y), without leaving log space"""
+    if x < y:
+        x, y = y, x
+    if y == -math.inf:
+        return x
+    return x + math.log1p(2.0 ** (y - x)) / math.log(2)
+
+
 def _overwrite_edge(edge, u, v):
     """Overwrites (x,v) with (x,u) and (v,x) with (u,x)"""
     (a, b) = edge
@@ -485,32 +528,221 @@ def contracted_nodes(H, u, v, ratcatcher=False, copy=False):
     return G
 
 
-def _node_ref(G,u):
-    """Resolves a node reference to its new representation
+class DisjointSet:
+    """The sets of nodes of a graph that have been contracted together
+
+    Each set is named after the node still present in the graph that its
+    nodes were contracted into. For example, if we contract edges (1,2),
+    (7,1), and (8,7), node 2 would resolve to node 8, because its absorber
+    1 has been contracted into node 7, and node 7 has been contracted into
+    node 8. The name is kept apart from the root of the set's tree, so
+    sets are merged by size, and finding a node compresses its path.
+
+    Attributes:
+
+        parent: a mapping from a node to its parent in the tree of its set
+
+        size: a mapping from the root of a tree to the size of its set
+
+        name: a mapping from the root of a tree to the name of its set
+    """
+
+    def __init__(self, nodes):
+        self.parent = {u: u for u in nodes}
+        self.size = dict.fromkeys(self.parent, 1)
+        self.name = dict(self.parent)
+
+    def _root(self, u):
+        """The root of the tree of u's set, pointing u and its ancestors at it"""
+        parent = self.parent
+
+        root = parent[u]
+        if parent[root] == root:
+            return root
+
+        while parent[root] != root:
+            root = parent[root]
+
+        while parent[u] != root:
+            parent[u], u = root, parent[u]
+
+        return root
+
+    def find(self, u):
+        """The node u has been contracted into"""
+        return self.name[self._root(u)]
+
+    def union(self, u, v):
+        """Contracts the set of v into the set of u, which keeps its name"""
+        root_u, root_v = self._root(u), self._root(v)
+        if root_u == root_v:
+            return
+
+        name = self.name[root_u]
+        if self.size[root_u] < self.size[root_v]:
+            root_u, root_v = root_v, root_u
+
+        self.parent[root_v] = root_u
+        self.size[root_u] += self.size.pop(root_v)
+        del self.name[root_v]
+        self.name[root_u] = name
+
+
+class OrderingEvaluator:
+    """Scores contraction orderings of a graph like contract_fast(), without networkx
+
+    The graph is compiled once into flat lists indexed by vertex id: its
+    adjacency in CSR form, with the weights alongside, and the product of
+    the weights around each vertex. Scoring an ordering resets buffers
+    kept between calls: a union-find over the vertex ids, the members of
+    each set as a circular list, and the product of the weights leaving
+    each set. Contracting two sets walks only the edges of the smaller,
+    to find those between the sets and those it adds to the larger's cut,
+    so no edge lists are built or merged. For integer weights the
+    products are exact, and so the Ct is the same as contract_fast()'s;
+    an edge within a set, a self-loop, is skipped as there. The weights
+    must be positive, as the cut of the merged set is divided by the
+    weights between the sets.
+
+    With log, the log2 weights are summed instead, and the scores are
+    the log2 of the Ct, as contract_fast(log=True), which cannot overflow
+    whatever the type of the weights.
+
+    The buffers make an evaluator unsafe to share between threads, but
+    not between processes, which each get their own copy.
+
+    Attributes:
+
+        vertices: the vertices of the graph, by id
+
+        vertex_id: a mapping from a vertex of the graph to its id
+
+        edges: the edges of the graph as pairs of vertex ids,
+            in the order of G.edges()
+
+        offsets: the edges around vertex id a are neighbours[offsets[a]:offsets[a + 1]]
+
+        neighbours: the other vertex id of each edge around each vertex
 
-    This function is a helper function to determine which node
-    is ultimately the node 'u' has been absorbed into. For
-    example, if we contract edges (1,2), (7,1), and (8,7), 
-    node 2 would resolve to node 8, because its absorber 1
-    has been contracted into node 7, and node 7 has been
-    contracted into node 8
+        weights: the weight of each edge around each vertex, or its log2 with log
+
+        log: whether scores are the log2 of the Ct
     """
-    assert hasattr(G, "overwrite")
 
-    # get the first node u was contracted into
-    ref = G.overwrite[u]
-    last = u
+    def __init__(self, G, log=False):
+        self.vertices = list(G)
+        self.vertex_id = {v: i for i, v in enumerate(self.vertices)}
+        self.edges = [(self.vertex_id[u], self.vertex_id[v]) for u, v in G.edges()]
+
+        incident = [[] for _ in self.vertices]
+        for (a, b), (_, _, w) in zip(self.edges, G.edges(data="weight")):
+            incident[a].append((b, w))
+            incident[b].append((a, w))
+
+        self.offsets = [0]
+        self.neighbours, self.weights = [], []
+        for edges in incident:
+            self.neighbours.extend(b for b, _ in edges)
+            self.weights.extend(w for _, w in edges)
+            self.offsets.append(len(self.neighbours))
+
+        self.log = log
+        if log:
+            # log2 weights are added, and subtracted to divide
+            self.weights = [math.log2(w) for w in self.weights]
+            self._multiply, self._divide, self._one = op.add, op.sub, 0
+        else:
+            # exact division for integer weights
+            integral = all(isinstance(w, int) for w in self.weights)
+            self._divide = op.floordiv if integral else op.truediv
+            self._multiply, self._one = op.mul, 1
+
+        # the product of the weights around each vertex, the cut of its set before contracting
+        self._vertex_cuts = [
+            functools.reduce(self._multiply, self.weights[start:end], self._one)
+            for start, end in zip(self.offsets, self.offsets[1:])
+        ]
+
+        # the buffers reset by each call, see _cost()
+        self._parent = list(range(len(self.vertices)))
+        self._ones = [1] * len(self.vertices)
+        self._size = list(self._ones)
+        self._cut = list(self._vertex_cuts)
+        self._members = list(range(len(self.vertices)))
+
+    def cost(self, ordering):
+        """The Ct, or its log2, of an ordering of indices into the edges of G, see contract_fast()"""
+        edges = self.edges
+        return self._cost(edges[i] for i in ordering)
+
+    def pair_cost(self, ordering):
+        """The Ct, or its log2, of an ordering of (node,node) pairs, see contract_fast()"""
+        vertex_id = self.vertex_id
+        return self._cost((vertex_id[u], vertex_id[v]) for u, v in ordering)
+
+    def _cost(self, pairs):
+        """The Ct, or its log2, of contracting a sequence of pairs of vertex ids"""
+        offsets, neighbours, weights = self.offsets, self.neighbours, self.weights
+        multiply, divide, one = self._multiply, self._divide, self._one
+
+        # a union-find over the vertex ids, by size with path compression,
+        # where each set's members are a circular list through 'members'
+        parent, size, cut, members = self._parent, self._size, self._cut, self._members
+        parent[:] = range(len(parent))
+        size[:] = self._ones
+        cut[:] = self._vertex_cuts
+        members[:] = range(len(members))
+
+        def find(x):
+            root = x
+            while parent[root] != root:
+                root = parent[root]
+            while parent[x] != root:
+                parent[x], x = root, parent[x]
+            return root
+
+        total_cost = 0
+        log_total_cost = -math.inf
+        for u, v in pairs:
+            u, v = find(u), find(v)
+
+            # skip this edge if the edge is (u,u) as a result of earlier contractions
+            if u == v:
+                continue
+
+            # contract the smaller set v into u
+            if size[u] < size[v]:
+                u, v = v, u
+
+            # the products of v's edges to u, and to neither set
+            between = outside = one
+            x = v
+            while True:
+                for i in range(offsets[x], offsets[x + 1]):
+                    root = find(neighbours[i])
+                    if root == u:
+                        between = multiply(between, weights[i])
+                    elif root != v:
+                        outside = multiply(outside, weights[i])
+                x = members[x]
+                if x == v:
+                    break
+
+            # the edges leaving either set, counting those between them once, as in cost()
+            if self.log:
+                log_total_cost = _log2_add(log_total_cost, cut[u] + outside)
+            else:
+                total_cost += cut[u] * outside
+            cut[u] = multiply(divide(cut[u], between), outside)
 
-    # backtrack until we've reached a node still present in G
-    while ref != last:
-        last = ref
-        ref = G.overwrite[ref]
+            parent[v] = u
+            size[u] += size[v]
+            members[u], members[v] = members[v], members[u]
 
-    # return that node, which is still present in G
-    return ref
+        return log_total_cost if self.log else total_cost
 
 
-def contract_fast(G, ordering, floats=None, ratcatcher=False):
+def contract_fast(G, ordering, floats=None, ratcatcher=False, log=False, exact=False):
     """Contracts G via an ordering
 
     Arguments:
@@ -525,17 +757,33 @@ def contract_fast(G, ordering, floats=None, ratcatcher=False):
             the ordering is indexed normally.
 
         ratcatcher: when True, sums multi-edge weights together
+
+        log: when True, contracts a copy of G with log2 weights, which add
+            as parallel edges merge, so the cost of each contraction is
+            the sum of its log2 weights, see log_cost(), and the total is
+            their log-sum-exp: the log2 of Ct as a float, with no big
+            products or overflow however large the weights.
+
+        exact: only with log, the total is instead the exact Ct, multiplied
+            out once at the end by an OrderingEvaluator.
     """
+    if exact and not log:
+        raise ValueError("exact applies to the log2 mode, the default total is already exact")
+
     graph_index = 0
-    total_cost = 0
+    total_cost = -math.inf if log else 0
 
     # get a copy of the graph
     H = nx.Graph(G)
+    if log:
+        for _, _, d in H.edges(data=True):
+            d["weight"] = math.log2(d["weight"])
+
+    # the pairs contracted, for an exact total
+    pairs = [] if exact else None
 
     # start with all nodes referring to themselves
-    H.overwrite = {}
-    for u in H:
-        H.overwrite[u] = u
+    contracted = DisjointSet(H)
 
     i = 0
     while graph_index < len(ordering):
@@ -543,7 +791,7 @@ def contract_fast(G, ordering, floats=None, ratcatcher=False):
         # get the next edge in the ordering
         (u, v) = ordering[floats[graph_index][0]] if floats else ordering[graph_index]
         # resolve the references to u and v, which may have been contracted into other nodes
-        (u, v) = _node_ref(H,u), _node_ref(H,v)
+        (u, v) = contracted.find(u), contracted.find(v)
 
         # skip this edge if the edge is (u,u) as a result of node overwrites
         if u == v:
@@ -551,17 +799,90 @@ def contract_fast(G, ordering, floats=None, ratcatcher=False):
             continue
 
         # calculates the cost of the contraction
-        total_cost += cost(H, [u, v])
+        if log:
+            total_cost = _log2_add(total_cost, log_cost(H, [u, v]))
+        else:
+            total_cost += cost(H, [u, v])
+
+        if pairs is not None:
+            pairs.append((u, v))
 
         # contract the two nodes
-        H = contracted_nodes(H, u, v, ratcatcher=ratcatcher)
+        H = contracted_nodes(H, u, v, ratcatcher=ratcatcher or log)
 
         # update the reference for node v, which was contacted into u
-        H.overwrite[v] = u
+        contracted.union(u, v)
 
         # move to next contraction
         graph_index += 1
 
         i += 1
 
+    if pairs is not None:
+        total_cost = OrderingEvaluator(G).pair_cost(pairs)
+
     return total_cost, H
+
+
+def contract_batch(G, orderings, log=False):
+    """The Ct of many orderings of the edges of G at once, see contract_fast()
+
+    The orderings are contracted in lockstep, one step of every ordering
+    at a time. Rather than a union-find per ordering, each ordering keeps
+    the set of both ends of every edge as arrays, so that a step is a
+    few operations over the population × edges arrays: its cost is the
+    product of the edges leaving the two sets, and merging relabels one
+    set as the other. An edge within a set costs nothing, as the self-loops
+    skipped by contract_fast().
+
+    Costs are float64 products of the weights, and agree with those of
+    contract_fast() to rounding.
+
+    Arguments:
+
+        G: the input networkx graph
+
+        orderings: a 2-D array of indices into list(G.edges()), one ordering per row
+
+        log: when True, sums log2 weights and returns the log2 of each Ct,
+            as contract_fast(log=True), which cannot overflow
+
+    Returns an array of the Ct of each ordering.
+    """
+    orderings = np.asarray(orderings, dtype=np.intp)
+    rows = np.arange(len(orderings))
+
+    vertex_id = {v: i for i, v in enumerate(G)}
+    ends = np.array(
+        [(vertex_id[u], vertex_id[v]) for u, v in G.edges()],
+        dtype=np.min_scalar_type(max(len(vertex_id) - 1, 0)),
+    ).reshape(-1, 2)
+    weights = np.array([w for _, _, w in G.edges(data="weight")], dtype=np.float64)
+    if log:
+        weights = np.log2(weights)
+    weights = np.broadcast_to(weights, (len(orderings), len(ends)))
+
+    # the set of each end of each edge, named by one of its vertices
+    heads = np.tile(ends[:, 0], (len(orderings), 1))
+    tails = np.tile(ends[:, 1], (len(orderings), 1))
+
+    total_cost = np.full(len(orderings), -np.inf if log else 0.0)
+    for step in orderings.T:
+        u, v = heads[rows, step][:, None], tails[rows, step][:, None]
+
+        # contract v into u; the cost is the product of the edges then
+        # leaving u, and of those that were between u and v
+        head_in_v, tail_in_v = heads == v, tails == v
+        np.copyto(heads, u, where=head_in_v)
+        np.copyto(tails, u, where=tail_in_v)
+        incident = ((heads == u) ^ (tails == u)) | (head_in_v ^ tail_in_v)
+
+        contracted = u[:, 0] != v[:, 0]
+        if log:
+            cost = np.sum(weights, axis=1, where=incident)
+            total_cost = np.where(contracted, np.logaddexp2(total_cost, cost), total_cost)
+        else:
+            cost = np.prod(weights, axis=1, where=incident)
+            total_cost += np.where(contracted, cost, 0.0)
+
+    return total_cost
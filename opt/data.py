@@ -1,6 +1,9 @@
 import os
 import csv
+import math
 import collections
+import itertools
+import random as rand
 import timeit
 
 import networkx as nx
@@ -8,7 +11,12 @@ import opt.contraction as contraction
 import opt.gencon.genetic as gencon
 
 from opt.rgraph import RGraph
-from opt.ratcatcher import carving_width, edge_contraction
+from opt.ratcatcher import (
+    EligibilityCache,
+    branching_edge_contraction,
+    carving_width,
+    edge_contraction,
+)
 from opt.util import is_close
 
 
@@ -150,9 +158,17 @@ class ResultsAggregator:
                     ordering = self.ordering[graph_id]
                     graph = self.graph[graph_id]
 
-                    # check that the sequence gives the advertised Ctime
-                    tested_ct,_ = contraction.contract_fast(graph,ordering)
-                    assert is_close(tested_ct, ct, 1e-13), f"Ct mismatch for {graph.name}: {ct}:{tested_ct}"
+                    # check that the sequence gives the advertised Ctime: exactly
+                    # for an integer Ct, and in log2 space for a float Ct, which is
+                    # rounded and may have overflowed
+                    if isinstance(ct, int):
+                        tested_ct,_ = contraction.contract_fast(graph,ordering)
+                        assert tested_ct == ct, f"Ct mismatch for {graph.name}: {ct}:{tested_ct}"
+                    else:
+                        tested_ct,_ = contraction.contract_fast(graph,ordering,log=True)
+                        log_ct = math.log2(ct) if ct else -math.inf
+                        assert tested_ct == log_ct or is_close(tested_ct, log_ct, 1e-9), \
+                            f"Ct mismatch for {graph.name}: {ct}:2**{tested_ct}"
 
                     # write the sequence to a file
                     graph_name = self.name[graph_id]
@@ -161,6 +177,90 @@ class ResultsAggregator:
                     order_writer.write(edge_string + "\n")
 
 
+def _ratcon_carving(args):
+    """Runs one edge contraction for RatconResultsAggregator.ratcon()
+
+    Arguments:
+        args: the RGraph to carve, the graph to contract, the carving width,
+            the edge selection strategy, the seed of the carving and the
+            number of workers testing its edges
+
+    Returns the Ct of the carving's contraction ordering, the ordering,
+    the time it took and the EligibilityCache of the carving.
+    """
+    g1, g2, cw, strategy, seed, workers = args
+
+    # seed the carving without disturbing the caller's rng
+    state = rand.getstate()
+    rand.seed(seed)
+
+    try:
+        # start the clock for this edge contraction algorithm
+        start_ec = timeit.default_timer()
+        # get the carving of the graph
+        cache = EligibilityCache()
+        carving = edge_contraction(
+            g1.copy(), cw, verbose=False, cache=cache, workers=workers, strategy=strategy
+        )
+        # get a memory-optimal edge contraction order
+        ordering = carving.ordering(memory_conscious=True)
+        # calculate the Ct of the contraction
+        cost, _ = contraction.contract_fast(g2.copy(), ordering)
+        # stop the clock for the edge contraction algorithm
+        end_ec = timeit.default_timer()
+    finally:
+        rand.setstate(state)
+
+    return cost, ordering, end_ec - start_ec, cache
+
+
+def _pooled_carvings(pool, workers, carving, seeder, launching):
+    """Runs carvings on a pool, see RatconResultsAggregator.ratcon()
+
+    Keeps 'workers' carvings under way while launching(i) allows
+    the i-th to start, and yields their results in order.
+
+    Arguments:
+        carving: the arguments of _ratcon_carving() up to the seed
+    """
+    pending = collections.deque()
+
+    for i in itertools.count():
+        while len(pending) < workers and launching(i + len(pending)):
+            task = (*carving, seeder.getrandbits(64), 1)
+            pending.append(pool.apply_async(_ratcon_carving, (task,)))
+
+        if not pending:
+            return
+
+        yield pending.popleft().get()
+
+
+def _branching_carvings(g1, g2, cw, strategy, seed, branches, fork_every, launching):
+    """Runs the carvings of branching_edge_contraction(), see RatconResultsAggregator.ratcon()
+
+    Yields their results like _ratcon_carving() while launching(i) allows the i-th.
+    """
+    carvings = branching_edge_contraction(
+        g1.copy(), cw, branches, fork_every=fork_every, seed=seed, strategy=strategy
+    )
+
+    for i in itertools.count():
+        if not launching(i):
+            return
+
+        start_ec = timeit.default_timer()
+        carving, cache = next(carvings, (None, None))
+        if carving is None:
+            return
+
+        ordering = carving.ordering(memory_conscious=True)
+        cost, _ = contraction.contract_fast(g2.copy(), ordering)
+        end_ec = timeit.default_timer()
+
+        yield cost, ordering, end_ec - start_ec, cache
+
+
 class RatconResultsAggregator(ResultsAggregator):
     """Aggregates ratcon results
 
@@ -176,10 +276,32 @@ class RatconResultsAggregator(ResultsAggregator):
 
         piecemeal_results_file_total_time: file path to write the running-total wall time
 
+        piecemeal_results_file_best: file path to stream each improvement of the best Ct to,
+            as it happens, when stream is True
+
         ordering_path: file path to write the final best contraction sequence
 
         num_edge_contractions: the number of times to run the edge-contraction algorithm
 
+        workers: the number of processes used to find the carving width and to run
+            the edge-contraction algorithms, see ratcon()
+
+        time_budget: when not None, the number of seconds to spend on each graph,
+            launching edge-contraction runs until it expires instead of running
+            self.num_edge_contractions of them
+
+        stream: when True, every improvement of the best Ct is appended to
+            self.piecemeal_results_file_best as soon as it is found
+
+        strategy: the order edge contraction tries edges in, see
+            opt.ratcatcher.selection_strategies
+
+        branching: when True, the carvings of a graph share their first contractions,
+            forking off each other, see opt.ratcatcher.branching_edge_contraction()
+
+        fork_every: when branching, the number of contractions between forks, or
+            None to spread the forks evenly
+
         carving_width: a mapping from graph id to carving width of said graph
 
         carving_width_time: a mapping from graph id to wall time of calculate carving width
@@ -188,24 +310,57 @@ class RatconResultsAggregator(ResultsAggregator):
 
         ec_time: a mapping from graph id to average edge contraction time over self.num_edge_contractions
 
+        ratcatcher_tests: a mapping from graph id to the average number of ratcatcher tests per carving
+
+        ratcatcher_tests_avoided: a mapping from graph id to the average number of ratcatcher tests
+            per carving that the eligibility cache avoided, see EligibilityCache
+
+        safe_contractions: a mapping from graph id to the average number of edges per carving
+            contracted without a ratcatcher test, their contraction being provably safe
+
+        shared_contractions: a mapping from graph id to the average number of contractions
+            per carving taken over from the carving it branched off, when branching
+
         piecemeal: a mapping from graph id to a dictionary of intermediate edge-contraction results
 
     """
-    def __init__(self, out_dir, num_edge_contractions):
+    def __init__(
+        self,
+        out_dir,
+        num_edge_contractions,
+        workers=1,
+        time_budget=None,
+        stream=False,
+        strategy="random",
+        branching=False,
+        fork_every=None,
+    ):
         super().__init__()
         self.outdir = out_dir
         self.aggregate_results_file = f"{self.outdir}/ratcon_aggregate_results.csv"
         self.piecemeal_results_file_value = f"{self.outdir}/ratcon_piecemeal_results_Ct.csv"
         self.piecemeal_results_file_ec_time = f"{self.outdir}/ratcon_piecemeal_results_ec_time.csv"
         self.piecemeal_results_file_total_time = f"{self.outdir}/ratcon_piecemeal_results_wall_time.csv"
+        self.piecemeal_results_file_best = f"{self.outdir}/ratcon_piecemeal_results_best.csv"
         self.ordering_path = f"{self.outdir}/ratcon_order.txt"
 
         self.num_edge_contractions = num_edge_contractions
+        self.workers = workers
+        self.time_budget = time_budget
+        self.stream = stream
+        self._streaming = False
+        self.strategy = strategy
+        self.branching = branching
+        self.fork_every = fork_every
 
         self.carving_width = {}
         self.carving_width_time = {}
         self.wall_time = {}
         self.ec_time = {}
+        self.ratcatcher_tests = {}
+        self.ratcatcher_tests_avoided = {}
+        self.safe_contractions = {}
+        self.shared_contractions = {}
         self.piecemeal = {}
 
 
@@ -226,7 +381,18 @@ class RatconResultsAggregator(ResultsAggregator):
             self.run_graph(g)
 
     def ratcon(self, graph, num_carvings):
-        """Runs ratcon on a graph, collects data on said graph"""
+        """Runs ratcon on a graph, collects data on said graph
+
+        Runs num_carvings edge contractions, or, with a time budget, keeps
+        launching them until the budget expires; the runs under way then
+        finish, and at least one always runs. The carvings are seeded from
+        a seed drawn from the global rng, so the results do not depend on
+        the number of workers. With more than one worker, the carvings are
+        spread over a pool of them; a single carving tests its candidate
+        edges on the pool instead. When branching, the carvings are made in
+        this process, as the branches of one tree of num_carvings carvings,
+        and a time budget stops the tree early.
+        """
         piecemeal_results = collections.defaultdict(list)
 
         g1, g2 = RGraph(graph.copy()), graph.copy()
@@ -236,29 +402,61 @@ class RatconResultsAggregator(ResultsAggregator):
         best_ordering = None
 
         # get the carving width of the graph
-        g1, cw = carving_width(g1, verbose=False)
+        g1, cw = carving_width(g1, verbose=False, workers=self.workers)
 
         end_cw_time = timeit.default_timer()
 
-        for _ in range(num_carvings):
-            # start the clock for this edge contraction algorithm
-            start_ec = timeit.default_timer()
-            # get the carving of the graph
-            carving = edge_contraction(g1.copy(), cw, verbose=False)
-            # get a memory-optimal edge contraction order
-            ordering = carving.ordering(memory_conscious=True)
-            # calculate the Ct of the contraction
-            cost, _ = contraction.contract_fast(g2.copy(), ordering)
-            # stop the clock for the edge contraction algorithm
-            end_ec = timeit.default_timer()
-
-            if cost < best_cost:
-                best_cost = cost
-                best_ordering = ordering
-
-            piecemeal_results['edge contraction time'].append(end_ec - start_ec)
-            piecemeal_results['total time'].append(end_ec - start)
-            piecemeal_results['Ct'].append(best_cost)
+        # the seeds of the carvings, however many there are
+        seeder = rand.Random(rand.getrandbits(64))
+
+        def launching(i):
+            if self.time_budget is None:
+                return i < num_carvings
+            return i == 0 or timeit.default_timer() - start < self.time_budget
+
+        pool = None
+        if self.branching:
+            carvings = _branching_carvings(
+                g1, g2, cw, self.strategy, seeder.getrandbits(64), num_carvings,
+                self.fork_every, launching,
+            )
+        elif self.workers > 1 and (num_carvings > 1 or self.time_budget is not None):
+            import multiprocessing
+
+            pool = multiprocessing.Pool(self.workers)
+            carvings = _pooled_carvings(
+                pool, self.workers, (g1, g2, cw, self.strategy), seeder, launching
+            )
+        else:
+            carvings = (
+                _ratcon_carving((g1, g2, cw, self.strategy, seeder.getrandbits(64), self.workers))
+                for _ in itertools.takewhile(launching, itertools.count())
+            )
+
+        try:
+            for cost, ordering, ec_time, cache in carvings:
+                # the carvings arrive in order, once every carving before them is done
+                end_ec = timeit.default_timer()
+
+                if cost < best_cost:
+                    best_cost = cost
+                    best_ordering = ordering
+
+                    if self.stream:
+                        self._stream_best(graph, len(piecemeal_results['Ct']), end_ec - start, cost)
+
+                piecemeal_results['edge contraction time'].append(ec_time)
+                piecemeal_results['total time'].append(end_ec - start)
+                piecemeal_results['Ct'].append(best_cost)
+                piecemeal_results['ratcatcher tests'].append(cache.tests)
+                piecemeal_results['ratcatcher tests avoided'].append(cache.avoided)
+                piecemeal_results['safe contractions'].append(cache.safe)
+                piecemeal_results['shared contractions'].append(cache.shared)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        runs = len(piecemeal_results['Ct'])
 
         self.carving_width_time[graph.id] = end_cw_time - start
         self.carving_width[graph.id] = cw
@@ -266,6 +464,35 @@ class RatconResultsAggregator(ResultsAggregator):
         self.ct[graph.id] = best_cost
         self.wall_time[graph.id] = end_ec - start
         self.ordering[graph.id] = best_ordering
+        self.ratcatcher_tests[graph.id] = sum(piecemeal_results['ratcatcher tests']) / runs
+        self.ratcatcher_tests_avoided[graph.id] = (
+            sum(piecemeal_results['ratcatcher tests avoided']) / runs
+        )
+        self.safe_contractions[graph.id] = sum(piecemeal_results['safe contractions']) / runs
+        self.shared_contractions[graph.id] = sum(piecemeal_results['shared contractions']) / runs
+
+    def _stream_best(self, graph, carving, total_time, cost):
+        """Appends an improvement of the best Ct of graph to the streamed results"""
+
+        if not os.path.exists(self.outdir):
+            os.makedirs(self.outdir)
+
+        field_names = ["name", "id", "carving", "total time", "Ct"]
+
+        # start a new file for each run of the aggregator
+        with open(self.piecemeal_results_file_best, "a" if self._streaming else "w") as rf:
+            results_writer = csv.DictWriter(rf, field_names, delimiter=",")
+            if not self._streaming:
+                results_writer.writeheader()
+                self._streaming = True
+
+            results_writer.writerow({
+                "name": graph.name,
+                "id": graph.id,
+                "carving": carving,
+                "total time": total_time,
+                "Ct": cost,
+            })
 
     def write(self):
         """Writes aggregate ratcon results"""
@@ -277,9 +504,17 @@ class RatconResultsAggregator(ResultsAggregator):
         name_field = "name"
         id_field = "id"
         wall_time_field = "ratcon wall time"
-        ct_field = f"ratcon Ct (best of {self.num_edge_contractions})"
+        ct_field = (
+            f"ratcon Ct (best of {self.num_edge_contractions})"
+            if self.time_budget is None
+            else f"ratcon Ct (best within {self.time_budget}s)"
+        )
         carving_width_field = "carving width"
         carving_width_time_field = "carving width time"
+        tests_field = "ratcatcher tests per carving"
+        tests_avoided_field = "ratcatcher tests avoided per carving"
+        safe_field = "safe contractions per carving"
+        shared_field = "shared contractions per carving"
 
         # write the aggregate results for each graph
         with open(self.aggregate_results_file, "w") as rf:
@@ -289,7 +524,11 @@ class RatconResultsAggregator(ResultsAggregator):
                 wall_time_field,
                 ct_field,
                 carving_width_field,
-                carving_width_time_field
+                carving_width_time_field,
+                tests_field,
+                tests_avoided_field,
+                safe_field,
+                shared_field,
             ]
 
             results_writer = csv.DictWriter(
@@ -305,7 +544,11 @@ class RatconResultsAggregator(ResultsAggregator):
                     wall_time_field: self.wall_time[graph_id],
                     ct_field: self.ct[graph_id],
                     carving_width_field: self.carving_width[graph_id],
-                    carving_width_time_field: self.carving_width_time[graph_id]
+                    carving_width_time_field: self.carving_width_time[graph_id],
+                    tests_field: self.ratcatcher_tests[graph_id],
+                    tests_avoided_field: self.ratcatcher_tests_avoided[graph_id],
+                    safe_field: self.safe_contractions[graph_id],
+                    shared_field: self.shared_contractions[graph_id],
                 }
                 results_writer.writerow(results)
 
@@ -334,9 +577,86 @@ class RatconResultsAggregator(ResultsAggregator):
             results_writer = csv.DictWriter(rf, field_names, extrasaction="ignore", delimiter=",")
             results_writer.writeheader()
 
+            # with a time budget, graphs can have different numbers of trials
             trials = {self.name[gid]: g_func(gid) for gid in self._processed_ids}
-            for trial in range(self.num_edge_contractions):
-                results_writer.writerow({name:cts[trial] for name,cts in trials.items()})
+            for trial in range(max(map(len, trials.values()), default=0)):
+                results_writer.writerow(
+                    {name: cts[trial] for name, cts in trials.items() if trial < len(cts)}
+                )
+
+
+def compare_strategies(graph_container, num_edge_contractions, out_dir, strategies, seed=1, workers=1):
+    """Runs ratcon with each edge selection strategy on the same graphs and seeds
+
+    Writes the ratcatcher tests per carving and the best Ct of every graph,
+    for every strategy, to ratcon_strategies.csv in out_dir, and returns
+    the rows written.
+    """
+
+    rows = []
+    for strategy in strategies:
+        rand.seed(seed)
+
+        ratcon_runner = RatconResultsAggregator(
+            out_dir, num_edge_contractions, workers=workers, strategy=strategy
+        )
+        ratcon_runner.run_container(graph_container)
+
+        for graph_id in ratcon_runner._processed_ids:
+            rows.append({
+                "strategy": strategy,
+                "name": ratcon_runner.name[graph_id],
+                "ratcatcher tests per carving": ratcon_runner.ratcatcher_tests[graph_id],
+                "safe contractions per carving": ratcon_runner.safe_contractions[graph_id],
+                f"ratcon Ct (best of {num_edge_contractions})": ratcon_runner.ct[graph_id],
+                "ratcon wall time": ratcon_runner.wall_time[graph_id],
+            })
+
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    with open(f"{out_dir}/ratcon_strategies.csv", "w") as rf:
+        results_writer = csv.DictWriter(rf, list(rows[0]), delimiter=",")
+        results_writer.writeheader()
+        results_writer.writerows(rows)
+
+    return rows
+
+
+def contract_fast_throughput(graph_container, num_sequences, seed=1, evaluator=False, batch=False, population=None):
+    """Times contraction.contract_fast() on random edge orderings, as gencon evaluates them
+
+    When evaluator is True, times a contraction.OrderingEvaluator instead,
+    including compiling it once per graph. When batch is True, times
+    contraction.contract_batch() on the orderings a population of
+    'population' at a time, all of them at once by default.
+
+    Returns a mapping from graph name to the number of orderings evaluated per second.
+    """
+
+    rng = rand.Random(seed)
+    throughput = {}
+    for graph in graph_container.graphs():
+        edges = list(graph.edges())
+        orderings = [rng.sample(edges, len(edges)) for _ in range(num_sequences)]
+
+        start = timeit.default_timer()
+        if batch:
+            index = {e: i for i, e in enumerate(edges)}
+            indices = [[index[e] for e in ordering] for ordering in orderings]
+            step = population or num_sequences
+            for i in range(0, num_sequences, step):
+                contraction.contract_batch(graph, indices[i:i + step], log=True)
+        elif evaluator:
+            compiled = contraction.OrderingEvaluator(graph)
+            for ordering in orderings:
+                compiled.pair_cost(ordering)
+        else:
+            for ordering in orderings:
+                contraction.contract_fast(graph, ordering)
+        throughput[graph.name] = num_sequences / (timeit.default_timer() - start)
+
+    return throughput
 
 
 class GenconResultsAggregator(ResultsAggregator):
@@ -392,7 +712,6 @@ class GenconResultsAggregator(ResultsAggregator):
 
         # get the best ordering
         _, best = res
-        best_score = best.keys[0].values[0]
         best_ordering_rep = best[0]
         edges = graph.edge_list
 
@@ -401,6 +720,10 @@ class GenconResultsAggregator(ResultsAggregator):
         else:
             best_ordering = best_ordering_rep
         
+        # record the winner's exact Ct, as its fitness is log2 Ct,
+        # see Representation.evaluate_fitness()
+        best_score, _ = contraction.contract_fast(graph, best_ordering)
+
         # gather data
         self.ct[graph.id] = best_score
         self.ordering[graph.id] = best_ordering
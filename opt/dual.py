@@ -1,7 +1,16 @@
 import networkx as nx
+import numpy as np
 
 from collections import defaultdict
 
+# scipy is not a requirement under pypy. Without it, csgraph is None, and
+# shortest distances and connected components fall back to networkx and
+# plain Python searches; opt.ratcatcher imports both names from here
+try:
+    from scipy.sparse import coo_matrix, csgraph
+except ImportError:
+    coo_matrix = csgraph = None
+
 class Dual(nx.MultiGraph):
     """A class for keeping track of properties relating to the dual graph of a plane graph
 
@@ -10,14 +19,23 @@ class Dual(nx.MultiGraph):
 
         distances: all paths, shortest distances, dictionary
 
+        _distance_matrix: the same shortest distances as a dense array
+
         faces: a list of faces in the dual. Each face is a list of edge sets.
 
+        face_vertices: a mapping from faces in G to the vertices incident to them
+
         d_crossing: a mapping from edges in G to edges in its planar dual
 
         incident_faces_dict: a mapping from edges in G to faces in G incident to those edges
 
         r_star: a mapping from vertices in G to faces in the planar dual
 
+        r_star_lengths: a mapping from vertices in G to the prefix sums of the
+            edge weights around their face in the planar dual, in walk order,
+            so the clockwise walk from r_star[v][j] to r_star[v][i] has length
+            r_star_lengths[v][i] - r_star_lengths[v][j]
+
         r: a mapping from vertices in the planar dual to faces in G
 
         v_star: a mapping from rooms in G to vertices in the planar dual
@@ -26,10 +44,15 @@ class Dual(nx.MultiGraph):
         super(Dual, self).__init__(*args, **kwargs)
         self.seed = G
         self.distances = None
+        self._distance_matrix = None
         self.faces = self.seed._enum_faces()
+        self.face_vertices = {
+            face: frozenset(v for edge in face for v in edge) for face in self.faces.values()
+        }
         self.d_crossing = {}
         self.incident_faces_dict = {}
         self.r_star = defaultdict(list)
+        self.r_star_lengths = {}
         self.r = {}
         self.v_star = {}
         self._init_dual()
@@ -41,42 +64,40 @@ class Dual(nx.MultiGraph):
 
         # (face_id, face)
         items = self.faces.items()
-        # edges seen so far
-        seen = set()
 
-        # add an edge in D for each edge in G
-        for id1, face1 in items:
-            for id2, face2 in items:
-                if id1 < id2:
-                    # for each edge shared between two faces of G
-                    # (can be more than 1)
-                    for edge in face1 & face2:
+        # the ids of the faces of G on either side of each edge of G,
+        # in ascending order
+        sides = defaultdict(list)
+        for face_id, face in items:
+            for edge in face:
+                sides[edge].append(face_id)
 
-                        if edge not in seen:
+        # add an edge in D for each edge in G between two faces
+        for edge, ids in sides.items():
+            # a bridge has the same face on both sides
+            if len(ids) != 2:
+                continue
 
-                            u, v = edge
+            id1, id2 = ids
+            u, v = edge
 
-                            # draw an edge between the two faces
-                            self.add_edge(
-                                id1, id2, edge=edge, weight=self.seed[u][v]["weight"]
-                            )
-                            key = max(k for k in self[id1][id2])
-                            # and add the edge in G to seen
-                            seen.add(edge)
+            # draw an edge between the two faces
+            key = self.add_edge(id1, id2, edge=edge, weight=self.seed[u][v]["weight"])
 
-                            # add the edges in the planar dual to the faces
-                            # surrounding nodes v and u
-                            self.r_star[v].append((id1, id2, key))
-                            self.r_star[u].append((id1, id2, key))
+            # add the edges in the planar dual to the faces
+            # surrounding nodes v and u
+            self.r_star[v].append((id1, id2, key))
+            self.r_star[u].append((id1, id2, key))
 
-                            # account for faces indicent to the edge in G
-                            self.incident_faces_dict[(u, v)] = self.incident_faces_dict[
-                                (v, u)
-                            ] = set([face1, face2])
+            # account for faces indicent to the edge in G
+            self.incident_faces_dict[(u, v)] = self.incident_faces_dict[
+                (v, u)
+            ] = set([self.faces[id1], self.faces[id2]])
 
         # order each face so that its edges are in order of incidence
         for v, r in self.r_star.items():
             self.r_star[v] = self._face_to_walk(r)
+            self.r_star_lengths[v] = self._walk_lengths(self.r_star[v])
 
         # track edge in planar dual crossing edge in graph
         for du, dv, key in self.edges(keys=True):
@@ -103,15 +124,113 @@ class Dual(nx.MultiGraph):
         return traversal
 
     def shortest_paths(self):
-        """Calculates all shortest paths in the planar dual"""
+        """Calculates all shortest paths in the planar dual, as a dict of dicts
+
+        distance_matrix() holds the same distances without building the dicts.
+        """
 
         if self.distances is None:
-            # the NetworkX version of shortest paths all pairs takes multiedges
-            # into account and uses the shortest edge length for each multiedge
-            self.distances = dict(nx.all_pairs_dijkstra_path_length(self))
+            if csgraph is None:
+                # the NetworkX version of shortest paths all pairs takes multiedges
+                # into account and uses the shortest edge length for each multiedge
+                self.distances = dict(nx.all_pairs_dijkstra_path_length(self))
+            else:
+                self.distances = {
+                    u: dict(enumerate(row)) for u, row in enumerate(self.distance_matrix().tolist())
+                }
 
         return self.distances
 
+    def distance_matrix(self):
+        """The shortest distances in the planar dual as a dense array, indexed by face id"""
+
+        if self._distance_matrix is None:
+            if csgraph is None:
+                distances = self.shortest_paths()
+                n = len(self.faces)
+
+                matrix = np.empty((n, n))
+                for u, row in distances.items():
+                    matrix[u, list(row.keys())] = list(row.values())
+
+                self._distance_matrix = matrix
+            else:
+                self._distance_matrix = self._dijkstra()
+
+        return self._distance_matrix
+
+    def _dijkstra(self, indices=None):
+        """Shortest distances from the faces 'indices', or from every face, using scipy
+
+        Parallel edges are collapsed to their minimum weight first, as
+        a sparse matrix would otherwise add them up.
+        """
+
+        weights = {}
+        for u, v, w in self.edges(data="weight"):
+            edge = (u, v) if u < v else (v, u)
+            if edge not in weights or w < weights[edge]:
+                weights[edge] = w
+
+        n = len(self.faces)
+        us = np.fromiter((u for u, _ in weights), dtype=int, count=len(weights))
+        vs = np.fromiter((v for _, v in weights), dtype=int, count=len(weights))
+        ws = np.fromiter(weights.values(), dtype=float, count=len(weights))
+        graph = coo_matrix((ws, (us, vs)), shape=(n, n)).tocsr()
+
+        return csgraph.dijkstra(graph, directed=False, indices=indices)
+
+    def contract_distances(self, parent, edge, origins):
+        """Derives the shortest distances of self from those of parent.
+
+        Here self is the dual of the minor of parent.seed with 'edge'
+        contracted, see RGraph.contract(). Contracting an edge of G
+        deletes the edge of the dual crossing it, and merging the parallel
+        edges left by a triangle face replaces its vertex in the dual by
+        a single edge of the same length, so only the distances whose
+        shortest paths used the deleted edge change. Only the rows of the
+        distance matrix with such a distance are recomputed.
+
+        Arguments:
+            parent: the dual of the graph 'edge' was contracted in
+            edge: the contracted edge of parent.seed
+            origins: the face id in parent of each face id of self
+        """
+
+        distances = parent.distance_matrix()
+        f1, f2, key = parent.d_crossing[edge]
+        weight = parent[f1][f2][key]["weight"]
+
+        # the pairs with a shortest path through the deleted edge, with
+        # some slack so that rounding cannot hide one
+        through = np.minimum(
+            distances[:, [f1]] + distances[[f2], :],
+            distances[:, [f2]] + distances[[f1], :],
+        ) + weight
+        used = through <= distances + 1e-9 * np.maximum(1.0, distances)
+
+        origins = np.asarray(origins)
+        matrix = distances[np.ix_(origins, origins)]
+        rows = np.flatnonzero(used[np.ix_(origins, origins)].any(axis=1))
+
+        if csgraph is not None and len(rows):
+            matrix[rows] = self._dijkstra(rows)
+            matrix[:, rows] = matrix[rows].T
+        else:
+            for u in rows:
+                row = nx.single_source_dijkstra_path_length(self, u)
+                vs = list(row.keys())
+                matrix[u, vs] = matrix[vs, u] = list(row.values())
+
+        self._distance_matrix = matrix
+
+    def _walk_lengths(self, walk):
+        """Prefix sums of the edge weights along a walk"""
+        lengths = [0]
+        for u1, u2, key in walk:
+            lengths.append(lengths[-1] + self[u1][u2][key]["weight"])
+        return lengths
+
     def _face_to_walk(self, face):
         """Orders edges in a face by incidence"""
         num_edges = len(face)
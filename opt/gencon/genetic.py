@@ -1,6 +1,9 @@
+import functools
 import random
 import multiprocessing
 
+import numpy as np
+
 from statistics import stdev, mean
 from deap import base, tools, algorithms, creator
 
@@ -9,6 +12,17 @@ import opt.gencon.pathopt as pathopt
 import opt.gencon.backbite as backbite
 
 
+# populations at least this large, of graphs with at most batch_max_edges
+# edges, are evaluated in chunks with contraction.contract_batch(), one
+# chunk per process of the pool, rather than one individual at a time;
+# a batch contraction step costs O(population × |E|), so on larger graphs
+# the pool of OrderingEvaluators is faster, see bench-contract --batch True.
+# Either way, the fitness of an edge or float individual is log2 Ct,
+# which a batch cannot overflow
+batch_population_size = 1000
+batch_max_edges = 200
+
+
 class Representation:
     def __init__(
         self,
@@ -31,8 +45,33 @@ class Representation:
         self.register(tb)
 
     def evaluate_fitness(self, *args, **kwargs):
+        """The fitness of an individual as a 1-tuple, minimized
+
+        For edge and float individuals, this is the log2 of the Ct of
+        their ordering, as contraction.contract_fast(log=True), so that
+        no weights overflow it.
+        """
+        raise NotImplementedError
+
+    def batch_orderings(self, individuals):
+        """The orderings of individuals, as rows of indices into self.graph.edge_list"""
         raise NotImplementedError
 
+    def map_batch(self, pool, evaluate, individuals):
+        """Evaluates individuals in chunks, in place of pool.map(evaluate, individuals)
+
+        Each process of the pool contracts one chunk of the orderings
+        together with contraction.contract_batch().
+        """
+        if not individuals:
+            return []
+        chunks = np.array_split(
+            self.batch_orderings(individuals),
+            min(multiprocessing.cpu_count(), len(individuals)),
+        )
+        costs = pool.map(functools.partial(contraction.contract_batch, self.graph, log=True), chunks)
+        return [(float(c),) for c in np.concatenate(costs)]
+
     def register(self, tb):
         # set up paralellism
         tb.register("select", tools.selTournament, tournsize=20)
@@ -44,7 +83,10 @@ class EdgeRepresentation(Representation):
         super().__init__(*args, **kwargs)
 
     def evaluate_fitness(self, individual):
-        return (contraction.contract_fast(self.graph, individual, floats=[])[0],)
+        return (self.evaluator.pair_cost(individual),)
+
+    def batch_orderings(self, individuals):
+        return np.array([[self.edge_index[e] for e in individual] for individual in individuals])
 
     # registers an individual/population represented by a list of edges
     def register(self, tb):
@@ -53,10 +95,12 @@ class EdgeRepresentation(Representation):
         edges = self.graph.edges()
         length = len(edges)
         self.graph.edge_list = list(edges)
+        self.edge_index = {e: i for i, e in enumerate(self.graph.edge_list)}
+        self.evaluator = contraction.OrderingEvaluator(self.graph, log=True)
 
         # register 'indices' function, which
         # takes a random ordering of the graph's edges
-        tb.register("indices", random.sample, edges, length)
+        tb.register("indices", random.sample, self.graph.edge_list, length)
 
         tb.register("individual", tools.initIterate, creator.Individual, tb.indices)
 
@@ -73,7 +117,11 @@ class FloatRepresentation(Representation):
 
     # evaluates the fitness of an individual represented by a list of floating points
     def evaluate_fitness(self, individual):
-        return (contraction.contract_fast(self.graph, self.graph.edge_list, floats=floats_to_ordering(individual))[0],)
+        return (self.evaluator.cost(i for i, _ in floats_to_ordering(individual)),)
+
+    def batch_orderings(self, individuals):
+        # a stable sort, as floats_to_ordering()
+        return np.argsort(np.array(individuals), axis=1, kind="stable")
 
     # registers an individual/population represented by a list of floats
     def register(self, tb):
@@ -81,6 +129,7 @@ class FloatRepresentation(Representation):
 
         length = len(self.graph.edges())
         self.graph.edge_list = list(self.graph.edges())
+        self.evaluator = contraction.OrderingEvaluator(self.graph, log=True)
 
         tb.register("rand", random.random)
 
@@ -266,15 +315,22 @@ def run_ga(G, representation, **kwargs):
     rep_object = rep_finder[representation](tb, G, representation, **kwargs)
 
     pool = multiprocessing.Pool()
-    tb.register("map", pool.map)
+    if (
+        rep_object.population_size >= batch_population_size
+        and G.number_of_edges() <= batch_max_edges
+    ):
+        tb.register("map", rep_object.map_batch, pool)
+    else:
+        tb.register("map", pool.map)
 
     hof = tools.HallOfFame(1)
 
+    # the fitness is the log2 of the Ct, see Representation.evaluate_fitness()
     stats = tools.Statistics(lambda ind: ind.fitness.values)
-    stats.register("avg", lambda v: mean(map(lambda x: x[0], v)))
-    stats.register("std", lambda v: stdev(map(lambda x: x[0], v)))
-    stats.register("min", lambda v: min(map(lambda x: x[0], v)))
-    stats.register("max", lambda v: max(map(lambda x: x[0], v)))
+    stats.register("avg log2Ct", lambda v: mean(map(lambda x: x[0], v)))
+    stats.register("std log2Ct", lambda v: stdev(map(lambda x: x[0], v)))
+    stats.register("min log2Ct", lambda v: min(map(lambda x: x[0], v)))
+    stats.register("max log2Ct", lambda v: max(map(lambda x: x[0], v)))
 
     pop, log = algorithms.eaSimple(
         population=tb.population(rep_object.population_size),
@@ -1,16 +1,22 @@
 import collections
 import math
+import pickle
+import sys
 
-import networkx as nx
+import numpy as np
 import random as rand
 
 from opt.contraction import ContractionTree
+from opt.dual import coo_matrix, csgraph
 
 zero_epsilon = (
     1.0e-11
 )  # If this isn't small enough, the assertion in log_binarysearchcw() will fail
 zero_epsilon_n = (-1) * zero_epsilon
 
+# the number of (edge, dual edge) pairs tested for noise at once
+_block_size = 2 ** 20
+
 
 class NoContractibleEdgeException(Exception):
     """
@@ -19,300 +25,987 @@ class NoContractibleEdgeException(Exception):
     pass
 
 
-def _prune_all_states(edge_states, room_states, incident_faces_dict):
-    """Prunes wall states and room states of the ratcatcher game. 
-
-    First prunes wall states by checking to see if there exists
-    an edge 'e' incident to face 'r' such that, for all vertices
-    of the component 'C' induced by 'e', all states (r,v) have 
-    been removed from room states. If this 'e' exists, (e,C) is
-    removed from the wall states. If this state (e,C) has been
-    removed, all states (r`,v) are removed, where 'r`' is the 
-    other room incident to 'e', and 'v' is every vertex in the
-    component 'C' induced by 'e'.
-    """
-
-    rooms_to_delete = collections.defaultdict(set)
-    walls_pruned = False
-
-    # 'for each face r'
-    for r, vs in room_states.items():
-        # 'and each edge e incident to r'
-        for e in r:
-            r1, r2 = incident_faces_dict[e]
-            r_inc = r2 if r == r1 else r1
-
-            if e in edge_states:
-                Cs = edge_states[e]
-                # 'if there is a state (e,C) such that'...
-                for c in range(len(Cs)):
-                    C = Cs[c]
-
-                    if C is not None:
-                        # (r,v) is deleted for every v of C
-                        all_removed = all((v not in vs for v in C))
-                        # 'for every vertex v of C, state (r,v) has been deleted'
-                        if all_removed:
-                            # '(e,C) becomes a losing state and is deleted'
-                            walls_pruned = True
-                            edge_states[e][c] = None
-                            # for the other face r_inc incident to e,
-                            # state (r_inc,v) is deleted from edge_states for every vertex v of C.
-                            for v in C:
-                                rooms_to_delete[r_inc].add(v)
-
-    return walls_pruned, rooms_to_delete
-
-
-def _get_connected_components(G):
+def _prune_states(components, room_states, walls, room_walls):
+    """Prunes wall states and room states of the ratcatcher game to a fixed point.
+
+    A wall state (e,C) becomes losing when there is a face 'r'
+    incident to 'e' such that, for all vertices 'v' of the component
+    'C' induced by 'e', the room state (r,v) has been removed. A losing
+    (e,C) is removed from the wall states, and every state (r`,v) is
+    removed, where 'r`' is the other room incident to 'e' and 'v' is
+    a vertex of 'C'.
+
+    Rather than rescanning every room and wall until nothing changes,
+    a counter of surviving room states is kept for every (e,C,r), and
+    a worklist of rooms that actually lost vertices only decrements
+    the counters of the walls of those rooms.
+
+    Arguments:
+        components: an (|E|, |V|) array labelling each vertex of G with
+            the smallest vertex of its component, for each edge the
+            ratcatcher can be on
+        room_states: an (|F|, |V|) boolean array of the surviving
+            room states (r,v). Mutated.
+        walls: an (|E|, 2) array of the two rooms incident to each edge
+        room_walls: a list mapping each room to an array of its edges
+
+    Returns True if the ratcatcher wins, i.e. some edge has lost all of
+    its wall states or some room has lost all of its room states.
+    """
+
+    num_edges, n = components.shape
+
+    # the wall states (e,C) that are still alive,
+    # marked on the smallest vertex of each component
+    alive = components == np.arange(n)
+
+    # the number of room states (r,v), v in C, still alive, per edge,
+    # per incident room r (side of the wall), per component C,
+    # offsetting labels to keep edges apart while counting
+    labels = components + (np.arange(num_edges) * n)[:, None]
+    counts = np.stack([
+        np.bincount(
+            labels[room_states[walls[:, side]]], minlength=num_edges * n
+        ).reshape(num_edges, n)
+        for side in (0, 1)
+    ], axis=1)
+
+    # the room states (r,v) that have been removed
+    # but not yet taken off the counters
+    removed = np.zeros_like(room_states)
+
+    # walls that are losing before any room state is removed
+    losing = (counts == 0) & alive[:, None, :]
+    alive &= ~losing.any(axis=1)
+    if not alive.any(axis=1).all():
+        return True
+
+    for side in (0, 1):
+        # for the other face r_inc incident to e, state (r_inc,v)
+        # is removed for every vertex v of every losing C
+        np.logical_or.at(
+            removed,
+            walls[:, 1 - side],
+            np.take_along_axis(losing[:, side], components, axis=1),
+        )
+
+    removed &= room_states
+    room_states &= ~removed
+    if not room_states.any(axis=1).all():
+        return True
+
+    worklist = collections.deque(np.flatnonzero(removed.any(axis=1)))
+    queued = np.zeros(len(room_states), dtype=bool)
+    queued[worklist] = True
+
+    while worklist:
+        r = worklist.popleft()
+        queued[r] = False
+
+        vs = np.flatnonzero(removed[r])
+        removed[r] = False
+
+        # only the counters of the walls of r are affected
+        es = room_walls[r]
+        sides = (walls[es, 0] != r).astype(np.intp)
+        cs = components[es[:, None], vs]
+        np.subtract.at(counts, (es[:, None], sides[:, None], cs), 1)
+
+        # '(e,C) becomes a losing state and is deleted'
+        # if 'for every vertex v of C, state (r,v) has been deleted'
+        rows, cols = np.nonzero(
+            (counts[es[:, None], sides[:, None], cs] == 0) & alive[es[:, None], cs]
+        )
+        if not len(rows):
+            continue
+
+        dead = np.zeros((len(es), n), dtype=bool)
+        dead[rows, cs[rows, cols]] = True
+
+        alive[es] &= ~dead
+        if not alive[es].any(axis=1).all():
+            return True
+
+        for i in np.unique(rows):
+            e = es[i]
+            r_inc = walls[e, 1 - sides[i]]
+
+            # for the other face r_inc incident to e, state (r_inc,v)
+            # is deleted for every vertex v of every losing C
+            deleted = dead[i][components[e]] & room_states[r_inc]
+            if not deleted.any():
+                continue
+
+            room_states[r_inc] &= ~deleted
+            if not room_states[r_inc].any():
+                return True
+
+            removed[r_inc] |= deleted
+            if not queued[r_inc]:
+                queued[r_inc] = True
+                worklist.append(r_inc)
+
+    return False
+
+
+def _get_connected_components(G, labels):
     """Calculate connected components of an adjacency-list representation of a graph.
 
-    Returns the connected componenents as a list of vertices lists.
+    The vertices of G are 0..n-1. Labels each vertex in 'labels' with
+    the smallest vertex of its component.
     """
-    ccs = []
-    seen = set()
-    for v in G:
-        if v not in seen:
-            cc = set()
+    seen = [False] * len(G)
+    for v in range(len(G)):
+        if not seen[v]:
+            seen[v] = True
             stack = [v]
             while stack:
                 u = stack.pop()
-                if u not in cc:
-                    cc.add(u)
-                    seen.add(u)
-                    stack += [n for n in G[u] if n not in seen]
-            ccs.append(cc)
+                labels[u] = v
+                for w in G[u]:
+                    if not seen[w]:
+                        seen[w] = True
+                        stack.append(w)
 
-    return ccs
+    return labels
 
 
-def _init_wall_states(G, D, k, dists):
+def _connected_components(n, us, vs):
+    """Labels the connected components of the graph on 0..n-1 with edges (us[i], vs[i]).
+
+    Returns an array labelling each vertex with the smallest vertex of
+    its component. Falls back to a pure-Python search when scipy is
+    unavailable.
     """
-    Generates an initial dictionary of wall states representing
-    the vertices a rat can be on when the ratcatcher is on edge 'e'.
+    labels = np.empty(n, dtype=int)
+
+    if csgraph is None:
+        G = [[] for _ in range(n)]
+        for u, v in zip(us.tolist(), vs.tolist()):
+            G[u].append(v)
+            G[v].append(u)
+        return _get_connected_components(G, labels)
+
+    adjacency = coo_matrix((np.ones(len(us), dtype=bool), (us, vs)), shape=(n, n))
+    num_components, components = csgraph.connected_components(adjacency, directed=False)
+
+    # the smallest vertex of each component
+    smallest = np.full(num_components, n)
+    np.minimum.at(smallest, components, np.arange(n))
+
+    labels[:] = smallest[components]
+    return labels
+
+
+def _dual_edge_arrays(D, index):
+    """Flattens the edges of the planar dual D into index arrays.
+
+    Returns the endpoints of every edge of D, their weights, and the
+    (relabelled) endpoints of the edge of G each of them crosses.
     """
+    num_edges = D.number_of_edges()
 
-    # wall states
-    states = collections.defaultdict(list)
-    d_edges = D.edges(data=True)
+    du = np.empty(num_edges, dtype=int)
+    dv = np.empty(num_edges, dtype=int)
+    weights = np.empty(num_edges)
+    gu = np.empty(num_edges, dtype=int)
+    gv = np.empty(num_edges, dtype=int)
+
+    for i, (v1, v2, data) in enumerate(D.edges(data=True)):
+        fu, fv = data["edge"]
+        du[i], dv[i], weights[i] = v1, v2, data["weight"]
+        gu[i], gv[i] = index[fu], index[fv]
 
-    for eu, ev in G.edges():
+    return du, dv, weights, gu, gv
 
-        # the edge the ratcatcher is on
-        edge = (eu, ev) if eu < ev else (ev, eu)
 
-        # init graph induced by ratcatcher being on edge 'edge'
-        Ge = {v: [] for v in G}
+def _dual_crossings(D, index, edges):
+    """Looks up the edge of the planar dual D crossing each edge in 'edges'.
+
+    Returns the endpoints of each crossing edge of D, its weight, and
+    the (relabelled) endpoints of the edge of G it crosses.
+    """
+    num_edges = len(edges)
 
-        # the edge in D associated with edge in G
+    u1s = np.empty(num_edges, dtype=int)
+    u2s = np.empty(num_edges, dtype=int)
+    weights = np.empty(num_edges)
+    eus = np.empty(num_edges, dtype=int)
+    evs = np.empty(num_edges, dtype=int)
+
+    for i, edge in enumerate(edges):
         u1, u2, ekey = D.d_crossing[edge]
+        u1s[i], u2s[i], weights[i] = u1, u2, D[u1][u2][ekey]["weight"]
+        eus[i], evs[i] = index[edge[0]], index[edge[1]]
 
-        pe = D[u1][u2][ekey]["weight"]
+    return u1s, u2s, weights, eus, evs
 
-        for (v1, v2, data) in d_edges:
 
-            fu, fv = data["edge"]
-            if fu in edge or fv in edge:
-                continue
+def _blocking_values(dists, crossings, dual_edges):
+    """
+    Yields the value of k up to which each edge of D stays quiet with the
+    ratcatcher on an edge 'e' of G, for a block of edges 'e' at once, by
+    broadcasting over the dense distance matrix 'dists'.
 
-            pf = data["weight"]
+    The ratcatcher on 'e' makes noise on an edge of D when k is greater
+    than either closed walk through e* and that edge. This is the one
+    place the two are compared, so that the thresholds of
+    RatcatcherInstance.thresholds() are exactly the values of k at which
+    _init_wall_states() changes.
 
-            if k > dists[u1][v1] + dists[u2][v2] + pf + pe:
-                continue
-            if k > dists[u1][v2] + dists[u2][v1] + pf + pe:
-                continue
+    Arguments:
+        dists: the dense distance matrix of the planar dual D
+        crossings: the edges of D crossing each edge of G, see _dual_crossings()
+        dual_edges: the edges of D, see _dual_edge_arrays()
+
+    Yields tuples of:
+        rows: a slice of the edges 'e' of G in the block
+        blocking: an (m, |E(D)|) array of the value of each edge of D, per 'e'
+        apart: an (m, |E(D)|) boolean array of the edges of D crossing an
+            edge of G not incident to 'e', the only ones that can be quiet
+    """
+
+    u1s, u2s, pes, eus, evs = crossings
+    du, dv, pf, gu, gv = dual_edges
+
+    # the number of edges of G handled at once
+    block = max(1, _block_size // max(1, len(du)))
+
+    for start in range(0, len(u1s), block):
+        rows = slice(start, start + block)
+
+        # the edges in D associated with the edges in G
+        u1, u2, pe = u1s[rows, None], u2s[rows, None], pes[rows, None]
+
+        # edges of G incident to an edge are not part of the graph
+        # induced by the ratcatcher being on that edge
+        eu, ev = eus[rows, None], evs[rows, None]
+        apart = (gu != eu) & (gu != ev) & (gv != eu) & (gv != ev)
+
+        blocking = np.minimum(
+            dists[u1, du] + dists[u2, dv] + pf + pe,
+            dists[u1, dv] + dists[u2, du] + pf + pe,
+        )
+
+        yield rows, blocking, apart
+
+
+def _init_wall_states(k, dists, crossings, dual_edges, n):
+    """
+    Generates the initial wall states, representing the vertices
+    a rat can be on when the ratcatcher is on edge 'e'.
+
+    The noisy edges of D are found for a block of edges 'e' at once,
+    see _blocking_values(), and the components of what remains are labelled by scipy, treating the
+    block as one graph with a disjoint copy of G per edge.
+
+    Arguments:
+        k: the carving width being tested
+        dists: the dense distance matrix of the planar dual D
+        crossings: the edges of D crossing each edge of G, see _dual_crossings()
+        dual_edges: the edges of D, see _dual_edge_arrays()
+        n: the number of vertices of G
+
+    Returns an (|E|, |V|) array labelling every vertex, per edge of G,
+    with the smallest vertex of its component.
+    """
+
+    _, _, _, gu, gv = dual_edges
+
+    # wall states
+    components = np.empty((len(crossings[0]), n), dtype=np.min_scalar_type(n))
 
-            Ge[fu].append(fv)
-            Ge[fv].append(fu)
+    for rows, blocking, apart in _blocking_values(dists, crossings, dual_edges):
+        # edges the ratcatcher makes noise on are not part of the graph
+        # induced by the ratcatcher being on that edge
+        quiet = apart & (k <= blocking)
 
-        # add the connected components that removing this noisy edge creates
-        states[edge] = _get_connected_components(Ge)
+        # add the connected components that removing the noisy edges creates
+        i, j = np.nonzero(quiet)
+        m = len(quiet)
+        labels = _connected_components(m * n, gu[j] + i * n, gv[j] + i * n)
+        components[rows] = labels.reshape(m, n) - (np.arange(m) * n)[:, None]
 
-    return states
+    return components
 
 
-def _vertex_in_face(r, v):
+def _walk_arrays(D, index, cutweights):
+    """
+    Pads the rooms r* of the planar dual D that are dual to the vertices of G
+    into arrays, with a row per vertex v (relabelled by 'index').
+
+    Returns a tuple of:
+        stars: an (|V|, d) array of the vertices of D around r*, in walk order
+        lts: a (|V|, d, d) array of the clockwise walk lengths around r*
+            from the j-th to the i-th of those vertices, at [v, i, j]
+        pairs: a (|V|, d, d) boolean mask of the valid pairs j ≤ i
+        walk_length: a (|V|, 1, 1) array of the length of each r*,
+            i.e. the cutweight of v
     """
-    Checks if a given vertex is incident to a given face/room
+    n = len(index)
+    d = max(len(r_star) for r_star in D.r_star.values())
+
+    stars = np.zeros((n, d), dtype=int)
+    lengths = np.zeros((n, d))
+    pairs = np.zeros((n, d, d), dtype=bool)
+    walk_length = np.empty((n, 1, 1))
 
-        Parameters
-        ----------
-        v : int
-    The vertex in question
+    lower = np.tril(np.ones((d, d), dtype=bool))
 
-        r : frozenset(edge)
-        A frozenset of edges
+    for v, i in index.items():
+        r_star = D.r_star[v]
+        num_room_edges = len(r_star)
+        assert num_room_edges >= 2
 
-        Returns
-        -------
-        vertex_in_face : boolean
-        Returns True if the vertex is incident to the face/room 'r',
-        and False otherwise.
+        stars[i, :num_room_edges] = [s_star for s_star, _, _ in r_star]
+        lengths[i, :num_room_edges] = D.r_star_lengths[v][:num_room_edges]
+        pairs[i, :num_room_edges, :num_room_edges] = lower[:num_room_edges, :num_room_edges]
+        walk_length[i] = cutweights[v]
+
+    # the clockwise distance from t* to s*, by prefix sums
+    lts = lengths[:, :, None] - lengths[:, None, :]
+
+    return stars, lts, pairs, walk_length
+
+
+def _walk_thresholds(dists, v_star, walks):
     """
-    for edge in r:
-        if v in edge:
-            return True
+    For every state (r,v) of a room r,
+    and given the vertex v* in D that is the dual of r,
+    and the rooms r* that are dual to each v,
+    returns the smallest max(|W(s*,t*)|,|W(t*,s*)|) over all s* and t*
+    incident to r*, as an array over v, where
+    |W(s*,t*)| = shortest_dist(v*,s*) + l(s*,t*) + shortest_dist(t*,v*)
+    and l(s*,t*) represent the clockwise walk around r* from s* to t*.
 
-    return False
+    The state (r,v) has a short walk for exactly those k greater than
+    its threshold, which does not depend on k.
+
+    Arguments:
+        dists: the dense distance matrix of D
+        v_star: the vertex of D dual to r
+        walks: the rooms r* as arrays, see _walk_arrays()
+    """
+    stars, lts, pairs, walk_length = walks
+
+    # shortest distances from v* to every s* (at i) and t* (at j)
+    dvs = dists[v_star][stars]
+    dvt = dvs[:, None, :]
+    dvs = dvs[:, :, None]
 
+    # the clockwise closed walk starting from v*
+    # including s* and t*
+    walk_st = dvt + dvs + lts
+    # the counterclockwise closed walk starting from v*
+    # including s* and t*
+    walk_ts = dvt + dvs + walk_length - lts
 
-def _short_walk(k, D, r, v, dists, cutweight):
+    walk = np.where(pairs, np.maximum(walk_st, walk_ts), math.inf)
+    return walk.min(axis=(1, 2))
+
+
+def _short_walks(k, dists, v_star, walks):
     """
-    For a given a state (r,v)
+    For every state (r,v) of a room r,
     and given a vertex v* in D that is the dual of r,
-    and a room r* that is the dual of v
+    and the rooms r* that are dual to each v,
     if there exists an s* or t* incident to r* such that
-    max(|W(s*,t*)|,|W(t*,s*)|) <= cw, then
+    max(|W(s*,t*)|,|W(t*,s*)|) < k, then
     (r,v) is pruned from the states of the game,
     where |W(s*,t*)| = shortest_dist(v*,s*) + l(s*,t*) + shortest_dist(t*,v*)
     and l(s*,t*) represent the clockwise walk around r* from s* to t*
+
+    Returns a boolean array over v, True where (r,v) is pruned.
+    """
+    return _walk_thresholds(dists, v_star, walks) < k
+
+
+def _init_room_states(room_states, index, r, face_vertices):
     """
+    Generates the room states that can occur in room 'r', pre-pruning.
+    All room states can be thought of as the Cartesian product between
+    all rooms and all vertices in G, stored as a boolean array with a
+    row per room and a column per vertex of G
 
-    walk_length = cutweight
+    Arguments:
 
-    v_star = D.v_star[r]
-    r_star = D.r_star[v]
+        room_states : an (|F|, |V|) boolean array. Mutated.
+        index : dict((vertex, int))
+        A mapping from a vertex in G to its column in room_states
+        r : the id of the room
+        face_vertices : frozenset(vertex)
+        The vertices incident to the room
 
-    num_room_edges = len(r_star)
-    assert num_room_edges >= 2
+    Returns:
+        room_states : an (|F|, |V|) boolean array whose row 'r' holds
+        True for every vertex of G that is a possible room state (r,v)
+    """
 
-    for i in range(num_room_edges):
-        s_star, _, _ = r_star[i]
+    states = room_states[r]
+    states[:] = True
 
-        # shortest distance from v* to s*
-        dvs = dists[v_star][s_star]
+    # vertices incident to the face are never room states
+    states[[index[v] for v in face_vertices]] = False
 
-        for j in range(i + 1):
-            t_star, _, _ = r_star[j]
+    return room_states
 
-            # shortest distance from v* to t*
-            dvt = dists[v_star][t_star]
-            
-            # find the clockwise distance from t* to s*
-            lts = 0
-            h = j
-            while h != i:
 
-                u1, u2, k = r_star[h]
+def _board(G, D):
+    """Relabels the pieces of the ratcatcher game to integers.
 
-                lts += D[u1][u2][k]["weight"]
+    Returns a mapping from each vertex of G to 0..|V|-1, a mapping from
+    each face of G to its id in D, the edges of G as ordered pairs, an
+    (|E|, 2) array of the ids of the two faces incident to each edge,
+    and a list mapping each face id to an array of its edge indices.
+    """
 
-                h = (h + 1) % num_room_edges
+    index = {v: i for i, v in enumerate(G)}
+    face_id = {face: f for f, face in D.faces.items()}
 
-            # the clockwise closed walk starting from v*
-            # including s* and t*
-            walk_st = dvt + dvs + lts
-            # the counterclockwise closed walk starting from v*
-            # including s* and t*
-            walk_ts = dvt + dvs + walk_length - lts
+    edges = [(u, v) if u < v else (v, u) for u, v in G.edges()]
+    edge_index = {edge: i for i, edge in enumerate(edges)}
 
-            if walk_st < k and walk_ts < k:
-                return True
+    walls = np.array(
+        [[face_id[r] for r in D.incident_faces_dict[edge]] for edge in edges],
+        dtype=int,
+    )
+    room_walls = [None] * len(D.faces)
+    for f, face in D.faces.items():
+        room_walls[f] = np.array([edge_index[edge] for edge in face], dtype=int)
 
-    return False
+    return index, face_id, edges, walls, room_walls
 
 
-def _init_room_states(room_states, verts, face, walk_pred, use_walk_pred=False):
-    """
-    Generates a dictionary representing all possible
-    room states that can occur, pre-pruning. Can be
-    thought of as the Cartesian product between all rooms
-    and all vertices in G, but separated to be a mapping
-    from room 'r' to all possible vertices in G, for each 'r'
+class RatcatcherInstance:
+    """The ratcatcher game on a fixed graph, for testing many thresholds k.
 
-    Arguments:
+    Everything that does not depend on k is computed once, when the
+    instance is built, so each call to test(k) only plays the game.
+    test(k) and thresholds() only read the arrays below, which share()
+    places in shared memory for worker processes to attach() to.
 
-        room_states : dict((room,{vertex}))
-        verts : [V]
-        face : [E]
-        faces : dict((int, {edges}))
-        A dictionary that maps an id of a room to a frozen set of edges
+    Attributes:
+        graph: the RGraph the game is played on
 
-    Returns:
-        room_states : dict((room,{vertex}))
-        A dictionary that maps a room, which is a
-        frozen set of edges, to a set of all vertices in G
-    """
+        dual: the planar dual of the graph
+
+        max_cutweight: the largest cutweight of a vertex in the graph,
+            a lower bound on the carving width
+
+        num_faces: the number of faces of the graph
+
+        num_edges: the number of edges of the graph
+
+        product_tests: a mapping from an integer bound to the result of
+            test_product(bound), see test_product()
+
+        distances: the dense matrix of shortest distances in the dual
+
+        index: a mapping from a vertex in the graph to 0..|V|-1
+
+        face_id: a mapping from a face of the graph to its vertex in the dual
+
+        edges: the edges of the graph as ordered pairs
+
+        walls: an (|E|, 2) array of the faces incident to each edge
 
-    def true_or_pred(face, v):
-        res = True if not use_walk_pred else not walk_pred(face,v)
-        return res 
+        room_walls: a list mapping each face id to an array of its edges
 
-    room_states[face] = set(
-        ( v for v in verts if (not _vertex_in_face(face, v)) and true_or_pred(face,v) )
+        room_walls_flat: the edges of every face, concatenated in face id order
+
+        crossings: the edges of the dual crossing each edge, see _dual_crossings()
+
+        dual_edges: the edges of the dual as index arrays, see _dual_edge_arrays()
+
+        room_states: the room states (r,v) before any pruning
+
+        use_walk_pred: when True, room states with a short walk are
+            pruned before the game is played
+
+        walks: the rooms of the dual around each vertex, see _walk_arrays()
+
+        walk_order: an array of (face id, vertex of the dual) pairs, in the
+            order the faces are checked for short walks
+    """
+
+    # the arrays test(k) and thresholds() read, as attribute names,
+    # with tuples of arrays stored under "name.i"
+    _arrays = (
+        "distances", "walls", "room_states", "room_walls_flat", "crossings",
+        "dual_edges", "walks", "walk_order",
     )
 
-    return room_states
+    def __init__(self, G, use_walk_pred=False):
+        self.graph = G
+        self.max_cutweight = max(G.cutweight(u) for u in G)
+        self.use_walk_pred = use_walk_pred
+
+        self.dual = D = G.dual()
+        self.num_faces = len(D.faces)
+        self.num_edges = G.number_of_edges()
+        self.product_tests = {}
+
+        if self.num_faces == 1:
+            return
+
+        self.distances = D.distance_matrix()
+
+        # vertices, faces and edges of G, relabelled to integers
+        self.index, self.face_id, self.edges, self.walls, self.room_walls = _board(G, D)
+        self.room_walls_flat = np.concatenate(self.room_walls)
+
+        self.crossings = _dual_crossings(D, self.index, self.edges)
+        self.dual_edges = _dual_edge_arrays(D, self.index)
+
+        # initialize room states
+        self.room_states = np.zeros((len(D.faces), len(self.index)), dtype=bool)
+        for face, r in self.face_id.items():
+            _init_room_states(self.room_states, self.index, r, D.face_vertices[face])
+
+        if use_walk_pred:
+            self.walks = _walk_arrays(D, self.index, {v: G.cutweight(v) for v in G})
+            self.walk_order = np.array(
+                [[self.face_id[D.r[v_star]], D.v_star[D.r[v_star]]] for v_star in D.bfs_traversal],
+                dtype=int,
+            )
+
+    def share(self):
+        """Copies the arrays of the game into shared memory.
+
+        Returns the SharedMemory blocks, which the caller must close()
+        and unlink() once done, and a small picklable description of the
+        instance to pass to attach() in another process.
+        """
+        from multiprocessing import shared_memory
+
+        blocks = []
+        spec = {
+            "max_cutweight": self.max_cutweight,
+            "num_faces": self.num_faces,
+            "num_edges": self.num_edges,
+            "use_walk_pred": self.use_walk_pred,
+            "arrays": {},
+        }
+
+        if self.num_faces == 1:
+            return blocks, spec
+
+        spec["room_sizes"] = [len(walls) for walls in self.room_walls]
+
+        for name in self._arrays:
+            if not hasattr(self, name):
+                continue
+
+            value = getattr(self, name)
+            parts = value if isinstance(value, tuple) else (value,)
+
+            for i, array in enumerate(parts):
+                block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+                np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+                blocks.append(block)
+
+                key = f"{name}.{i}" if isinstance(value, tuple) else name
+                spec["arrays"][key] = (block.name, array.shape, array.dtype.str)
+
+        return blocks, spec
+
+    @classmethod
+    def attach(cls, spec):
+        """Rebuilds an instance from shared memory, see share().
+
+        The attached instance has no graph or dual, and can only test(k)
+        and find thresholds().
+        """
+        from multiprocessing import shared_memory
+
+        self = cls.__new__(cls)
+        self.graph = self.dual = None
+        self.max_cutweight = spec["max_cutweight"]
+        self.num_faces = spec["num_faces"]
+        self.num_edges = spec["num_edges"]
+        self.product_tests = {}
+        self.use_walk_pred = spec["use_walk_pred"]
+
+        # keep the blocks open for as long as the instance lives
+        self._blocks = []
+        parts = {}
+        for key, (block_name, shape, dtype) in spec["arrays"].items():
+            block = shared_memory.SharedMemory(name=block_name)
+            self._blocks.append(block)
+            array = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+
+            name, _, i = key.partition(".")
+            if i:
+                parts.setdefault(name, {})[int(i)] = array
+            else:
+                setattr(self, name, array)
+
+        for name, arrays in parts.items():
+            setattr(self, name, tuple(arrays[i] for i in range(len(arrays))))
+
+        if self.num_faces > 1:
+            offsets = np.cumsum(spec["room_sizes"])[:-1]
+            self.room_walls = np.split(self.room_walls_flat, offsets)
 
+        return self
 
-def ratcatcher(G, k):
+    def test(self, k):
+        """Tests if the graph has a carving width < k."""
+
+        # the carving width is at least the max cutweight of the graph
+        if self.max_cutweight >= k:
+            return False
+
+        if self.num_faces == 1:
+            return True
+
+        room_states = self.room_states.copy()
+
+        # filter early violations of criteria
+        # if no room states are left for a particular face, cw < k
+        if not room_states.any(axis=1).all():
+            return True
+
+        if self.use_walk_pred:
+            for r, v_star in self.walk_order:
+
+                # prune the room states of the face with a short walk, in one batch
+                room_states[r] &= ~_short_walks(k, self.distances, v_star, self.walks)
+                if not room_states[r].any():
+                    return True
+
+        # states representing where the rat can move
+        # depending on what edge the ratcatcher is on, and how much noise it's making,
+        # as the component label of every vertex per edge
+        components = _init_wall_states(
+            k, self.distances, self.crossings, self.dual_edges, room_states.shape[1]
+        )
+
+        # prune losing states until a fixed point is reached
+        return _prune_states(components, room_states, self.walls, self.room_walls)
+
+    def test_product(self, bound):
+        """Tests if the graph has a carving width ≤ log2(bound), exactly.
+
+        With integer weights under apply_logweights(), the carving width is
+        the log of an integer, the largest product of the weights across a
+        cut, so the game is played half way between the logs of bound and
+        bound + 1, out of reach of the rounding of the sums of log weights.
+        The results are cached by bound.
+
+        Raises ValueError when the rounding could reach the neighbouring
+        integers, see _product_threshold().
+        """
+        if bound not in self.product_tests:
+            self.product_tests[bound] = self.test(_product_threshold(bound, self.num_edges))
+
+        return self.product_tests[bound]
+
+    def thresholds(self, low=-math.inf, high=math.inf):
+        """The distinct values of k in [low, high) at which the game can change.
+
+        Every state of the game survives for k up to a threshold that does
+        not depend on k, and is removed for every k greater than it: a quiet
+        edge of the dual becomes noisy, a room state gets a short walk, or
+        k passes the max cutweight. test(k) is therefore constant for k
+        between consecutive thresholds, and the carving width is one of them.
+
+        Returns a sorted array of the thresholds in [low, high).
+        """
+
+        found = [np.array([self.max_cutweight], dtype=float)]
+
+        if self.num_faces > 1:
+            dists = self.distances
+
+            # the noise thresholds of the edges that can be quiet
+            for _, blocking, apart in _blocking_values(dists, self.crossings, self.dual_edges):
+                noise = blocking[apart]
+                found.append(noise[(low <= noise) & (noise < high)])
+
+            if self.use_walk_pred:
+                for r, v_star in self.walk_order:
+                    walk = _walk_thresholds(dists, v_star, self.walks)
+                    walk = walk[self.room_states[r]]
+                    found.append(walk[(low <= walk) & (walk < high)])
+
+        found = np.concatenate(found)
+        return np.unique(found[(low <= found) & (found < high)])
+
+
+def _product_threshold(bound, num_edges):
+    """The k testing a carving width ≤ log2(bound) exactly, see RatcatcherInstance.test_product()
+
+    The game sums up to 2|E| + 1 log weights, each rounded once, so the sums
+    near k are off by less than (2|E| + 2) ulps of k; k must be further than
+    that from the logs of bound and bound + 1.
+    """
+    # the distance from log2(bound + 1/2) to the nearer of log2(bound), log2(bound + 1)
+    margin = math.log1p(0.5 / (bound + 0.5)) / math.log(2)
+    error = (2 * num_edges + 2) * sys.float_info.epsilon * math.log2(bound + 1)
+
+    if error >= margin:
+        raise ValueError(
+            f"products around {bound} are too close to test exactly in double precision"
+        )
+
+    return math.log2(bound + 0.5)
+
+
+def ratcatcher(G, k, use_walk_pred=False):
     """Tests if a graph G has a carving width < k.
 
     Returns True if the graph has carving width less than k, False otherwise.
+    To test the same graph against many k, build a RatcatcherInstance once.
 
     Arguments:
         G: the input RGraph object
         k: an integer to test carving width against
+        use_walk_pred: when True, room states with a short walk are pruned
     """
 
-    # the carving width is at least the max cutweight of the graph
+    # the carving width is at least the max cutweight of the graph,
+    # checked before paying for the planar dual
     if max(G.cutweight(u) for u in G) >= k:
         return False
 
-    # get the planar dual of the graph
-    D = G.dual()
+    return RatcatcherInstance(G, use_walk_pred=use_walk_pred).test(k)
 
-    if len(D.faces) == 1:
-        return True
 
-    # shortest distances between all pairs of vertices in D
-    dists = D.shortest_paths()
+class EligibilityCache:
+    """Remembers the edges found ineligible in earlier steps of edge_contraction().
 
-    # vertices of G
-    vs = G.nodes()
+    Contracting an edge elsewhere in the graph rarely makes an ineligible
+    edge eligible, so an edge that failed with the same neighbourhood as it
+    has now is only tried once every other edge of the step has failed.
+    An edge is keyed by its endpoints, and its neighbourhood by the weighted
+    edges incident to them, so any contraction that touches the edge gives
+    it a fresh start. Deferred edges are still tried before giving up, so
+    the cache never makes a step fail.
 
-    # a lambda for determining if a walk is too short
-    walk_pred = lambda face, v: _short_walk(
-        k, D, face, v, dists, cutweight=G.cutweight(v)
-    )
+    Attributes:
+        failed: a mapping from edge to the neighbourhood signature it failed with
 
-    # initialize room states and filter early violations of criteria
-    # if no room states are left for a particular face, cw < k
-    room_states = {}
-    for v_star in D.bfs_traversal:
-        neib_face = D.r[v_star]
-        room_states = _init_room_states(room_states, vs, neib_face, walk_pred)
-        if not room_states[neib_face]:
-            return True
+        tests: the number of candidate minors the ratcatcher was run on
+
+        cutweight_rejections: the number of edges rejected by the cutweight
+            of their contraction alone, without building the candidate minor
+
+        safe: the number of edges contracted without running the ratcatcher,
+            their contraction being no wider than the graph, see _is_safe_contraction()
 
-    # states representing where the rat can move
-    # depending on what edge the ratcatcher is on, and how much noise it's making
-    # of the form {e:set(C)}
-    wall_states = _init_wall_states(G, D, k, dists)
+        shared: the number of contractions the carving took over from the
+            carving it branched off, see branching_edge_contraction()
 
-    walls_pruned = True
-    rooms_to_delete = True
+        hits: the number of edges deferred, having failed with the same signature
 
-    while walls_pruned or rooms_to_delete:
-        # prune states once
-        walls_pruned, rooms_to_delete = _prune_all_states(
-            wall_states, room_states, D.incident_faces_dict
+        avoided: the number of deferred edges never tried, as an eligible
+            edge was found first, less those the cutweight check would have
+            rejected without a test
+
+        stale: the number of deferred edges tried and found eligible
+    """
+
+    def __init__(self):
+        self.failed = {}
+        self.tests = 0
+        self.cutweight_rejections = 0
+        self.safe = 0
+        self.shared = 0
+        self.hits = 0
+        self.avoided = 0
+        self.stale = 0
+
+    def fork(self, shared):
+        """A cache for a carving branching off this one after 'shared' contractions
+
+        It knows the edges that failed so far, and counts only its own tests.
+        """
+        fork = EligibilityCache()
+        fork.failed = dict(self.failed)
+        fork.shared = shared
+        return fork
+
+    @staticmethod
+    def signature(G, eu, ev):
+        """The weighted edges incident to eu or ev"""
+        return frozenset(
+            (frozenset((x, y)), d["weight"]) for x, y, d in G.edges((eu, ev), data=True)
         )
 
-        # prune states for next iteration
-        for Cs in wall_states.values():
-            if all((C is None for C in Cs)):
-                return True
-        for f in rooms_to_delete:
-            room_states[f] -= rooms_to_delete[f]
-            if not room_states[f]:
-                return True
+    def partition(self, G, edges):
+        """Splits edges into those to try first and those that failed with the same signature"""
+        fresh, deferred = [], []
+        for eu, ev in edges:
+            signature = self.failed.get(frozenset((eu, ev)))
+            if signature is not None and signature == self.signature(G, eu, ev):
+                deferred.append((eu, ev))
+            else:
+                fresh.append((eu, ev))
+
+        self.hits += len(deferred)
+        return fresh, deferred
+
+    def fail(self, G, eu, ev):
+        """Records that the edge (eu,ev) of G is ineligible"""
+        self.failed[frozenset((eu, ev))] = self.signature(G, eu, ev)
+
+    def hit_rate(self):
+        """The fraction of edge tests the cache saved"""
+        saved = self.avoided
+        return saved / (saved + self.tests) if saved + self.tests else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.tests} ratcatcher tests, {self.safe} safe contractions, "
+            f"{self.cutweight_rejections} cutweight rejections, "
+            f"{self.hits} deferred edges, {self.avoided} tests avoided, {self.stale} stale, "
+            f"hit rate {self.hit_rate():.2f}"
+        )
 
-    return False
+
+def _merged_cutweight(G, eu, ev):
+    """The cutweight of the vertex that contracting the edge (eu,ev) of G creates"""
+    return G.cutweight(eu) + G.cutweight(ev) - 2 * G[eu][ev]["weight"]
+
+
+def _is_safe_contraction(G, eu, ev):
+    """Whether contracting the edge (eu,ev) of G cannot widen its carving width
+
+    Placing the merged vertex at the leaf of eu, in a carving of G, only
+    changes the cuts separating eu from ev: each loses the weight of the
+    edge and the edges of ev on eu's side, and gains the edges of ev on the
+    other side, at most the cutweight of ev less twice the weight of the
+    edge. So when the edge carries at least half of the cutweight of either
+    endpoint, no cut grows, e.g. for an endpoint of degree 2 whose other
+    edge is no heavier, or one whose edges all run to the other endpoint.
+    """
+    return 2 * G[eu][ev]["weight"] >= min(G.cutweight(eu), G.cutweight(ev))
+
+
+def _random_order(G, edges):
+    """Orders edges uniformly at random"""
+    rand.shuffle(edges)
+
+
+def _max_weight_order(G, edges):
+    """Orders edges by weight, heaviest first, and ties at random"""
+    rand.shuffle(edges)
+    edges.sort(key=lambda e: -G[e[0]][e[1]]["weight"])
 
 
+def _min_cutweight_order(G, edges):
+    """Orders edges by the cutweight of their contraction, smallest first, and ties at random"""
+    rand.shuffle(edges)
+    edges.sort(key=lambda e: _merged_cutweight(G, *e))
 
-def _find_eligible_edge(G, k, verbose=False):
+
+def _face_size_order(G, edges):
+    """Orders edges by the smallest face they bound, smallest first, and ties at random
+
+    Contracting an edge of a triangle merges two of its edges, which
+    shrinks the cuts around it.
+    """
+    sizes = {}
+    for face in G.faces():
+        for u, v in face:
+            edge = frozenset((u, v))
+            sizes[edge] = min(sizes.get(edge, math.inf), len(face))
+
+    rand.shuffle(edges)
+    edges.sort(key=lambda e: sizes.get(frozenset(e), math.inf))
+
+
+# the orders _find_eligible_edge() can try edges in, by name. Each one
+# sorts a list of edges of an RGraph in place
+selection_strategies = {
+    "random": _random_order,
+    "max-weight": _max_weight_order,
+    "min-cutweight": _min_cutweight_order,
+    "face-size": _face_size_order,
+}
+
+
+def _test_edge(G, k, eu, ev):
+    """Tests if the edge (eu,ev) of G is eligible, see _find_eligible_edge().
+
+    Contracts the edge in place, and leaves it contracted if eligible.
+    The ratcatcher is not run on safe contractions, see _is_safe_contraction(),
+    as G has a carving width < k and its minor is no wider.
+
+    Returns whether the edge is eligible, whether the ratcatcher was run on
+    it, and whether it was eligible without running the ratcatcher.
+    """
+
+    safe = _is_safe_contraction(G, eu, ev)
+
+    # contract the edge, G is now the potential new graph
+    G.contract(eu, ev)
+
+    eligible = tested = False
+    if G.is_biconnected():
+        if safe:
+            eligible = True
+        else:
+            tested = True
+            eligible = ratcatcher(G, k)
+
+    if not eligible:
+        G.undo()
+
+    return eligible, tested, eligible and not tested
+
+
+def _share_graph(G):
+    """Pickles G into shared memory once, for the workers testing its edges.
+
+    Returns the SharedMemory block, which the caller must close() and
+    unlink() once done, and a small picklable description of it to pass
+    to _test_shared_edge() in another process.
+    """
+    from multiprocessing import shared_memory
+
+    payload = pickle.dumps(G, protocol=pickle.HIGHEST_PROTOCOL)
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(payload)))
+    block.buf[:len(payload)] = payload
+
+    return block, (block.name, len(payload))
+
+
+# the graph a candidate worker tests edges of, by the name of its block, see _test_shared_edge()
+_candidate_graph = (None, None)
+
+
+def _test_shared_edge(spec, k, eu, ev):
+    """Tests an edge of a graph shared by _share_graph(), see _test_edge()
+
+    A worker unpickles each shared graph once, and undoes the edge after
+    testing it, so that the graph stays as shared for its next edge.
+    """
+    global _candidate_graph
+    from multiprocessing import shared_memory
+
+    name, size = spec
+    if _candidate_graph[0] != name:
+        block = shared_memory.SharedMemory(name=name)
+        view = block.buf[:size]
+        try:
+            _candidate_graph = (name, pickle.loads(view))
+        finally:
+            view.release()
+            block.close()
+
+    G = _candidate_graph[1]
+    result = _test_edge(G, k, eu, ev)
+    if result[0]:
+        G.undo()
+
+    return result
+
+
+def _find_eligible_edge(
+    G, k, verbose=False, cache=None, pool=None, workers=1, strategy="random", excluded=()
+):
     """Finds an edge in G that can be contracted
 
     An edge is eligible if its contraction results
@@ -321,30 +1014,103 @@ def _find_eligible_edge(G, k, verbose=False):
         - the max cutweight < k
         - the minor is biconnected
         - the carving width of the minor < k
-    """
-
-    # keep track of contractible edges
-    eligible_edges = list(G.edges())
-
-    while eligible_edges:
 
-        # get next potential edge to contract
-        eid = rand.randint(0,len(eligible_edges)-1)
-        eu,ev = eligible_edges[eid]
-
-        # contract the edge, get the potential new graph
-        candidate = G.get_candidate(eu,ev)
+    Edges that failed in earlier steps, with the same neighbourhood, are
+    tried last, see EligibilityCache. The edges are tried in the order of
+    'strategy', a name in selection_strategies or a function like them,
+    in batches of 'workers' edges tested at once on 'pool', and the first
+    eligible edge in that order is taken, so the edge found does not
+    depend on the number of workers, and neither do the statistics counted
+    in the cache, which stop at that edge. The workers get G once per call,
+    through shared memory, see _share_graph(). The edges in 'excluded' are
+    not tried.
+
+    Returns the edge, which is left contracted in G, see RGraph.contract().
+    """
 
-        if nx.is_biconnected(candidate) and ratcatcher(candidate, k + zero_epsilon):
-            return eu, ev, candidate
-        else:
-            del eligible_edges[eid]
+    if cache is None:
+        cache = EligibilityCache()
+
+    order = selection_strategies.get(strategy, strategy)
+
+    # keep track of contractible edges, in an order that does not
+    # depend on the contractions tried and undone before
+    edges = sorted((u, v) if u < v else (v, u) for u, v in G.edges())
+    fresh, deferred = cache.partition(G, [e for e in edges if e not in excluded])
+
+    # the deferred edges the cutweight check would not have rejected anyway,
+    # whose tests are avoided if a fresh edge is eligible
+    testable = sum(_merged_cutweight(G, eu, ev) < k + zero_epsilon for eu, ev in deferred)
+
+    block = None
+    if pool is not None:
+        # derive the dual before sharing G with the workers, so that their
+        # candidates can derive theirs from it
+        G.dual()
+        block, spec = _share_graph(G)
+
+    try:
+        for eligible_edges in (fresh, deferred):
+            order(G, eligible_edges)
+            edges = iter(eligible_edges)
+
+            while True:
+                # get next potential edges to contract, with the number of
+                # edges rejected by their cutweight just before each
+                batch = []
+                rejected = 0
+                for eu, ev in edges:
+                    # the contraction only changes the cutweight of the merged vertex,
+                    # which can be checked before contracting
+                    if _merged_cutweight(G, eu, ev) >= k + zero_epsilon:
+                        rejected += 1
+                        continue
+
+                    batch.append((eu, ev, rejected))
+                    rejected = 0
+                    if len(batch) == workers:
+                        break
+
+                if pool is None:
+                    # lazily, so that testing stops at the first eligible edge
+                    results = (_test_edge(G, k + zero_epsilon, eu, ev) for eu, ev, _ in batch)
+                else:
+                    # every worker tests its edge on its own copy of G
+                    results = pool.starmap(
+                        _test_shared_edge,
+                        [(spec, k + zero_epsilon, eu, ev) for eu, ev, _ in batch],
+                    )
+
+                # count only the edges up to the one taken, as a serial search would
+                for (eu, ev, rejections), (eligible, tested, safe) in zip(batch, results):
+                    cache.cutweight_rejections += rejections
+                    cache.tests += tested
+                    cache.safe += safe
+
+                    if eligible:
+                        if pool is not None:
+                            G.contract(eu, ev)
+
+                        if eligible_edges is deferred:
+                            cache.stale += 1
+                        else:
+                            cache.avoided += testable
+                        return eu, ev
+
+                    cache.fail(G, eu, ev)
+
+                cache.cutweight_rejections += rejected
+                if not batch:
+                    break
+    finally:
+        if block is not None:
+            block.close()
+            block.unlink()
 
     raise NoContractibleEdgeException("A contractible edge was not found!")
 
 
-
-def edge_contraction(G, cw, verbose=False):
+def edge_contraction(G, cw, verbose=False, cache=None, workers=1, strategy="random"):
     """The edge-contraction algorithm.
 
     A loop of finding an eligible edge and contracting said edge.
@@ -354,25 +1120,66 @@ def edge_contraction(G, cw, verbose=False):
         G: the input RGraph object
         cw: the carving width of the graph
         verbose: when true, prints the selected edge for contraction
+        cache: the EligibilityCache to use, which counts the tests the
+            carving needed and avoided. A new one when None
+        workers: the number of processes testing candidate edges at once.
+            The carving does not depend on it
+        strategy: the order to try edges in, see selection_strategies
     """
 
+    if workers > 1:
+        import multiprocessing
+        from multiprocessing import resource_tracker
+
+        # start the tracker of the graphs shared with the workers, see
+        # _share_graph(), before forking them, so that they share it
+        resource_tracker.ensure_running()
+        pool = multiprocessing.Pool(workers)
+        try:
+            return _edge_contraction(G, cw, verbose, cache, pool, workers, strategy)
+        finally:
+            pool.terminate()
+
+    return _edge_contraction(G, cw, verbose, cache, None, 1, strategy)
+
+
+def _edge_contraction(G, cw, verbose, cache, pool, workers, strategy):
+    """edge_contraction(), testing candidate edges on 'pool' if not None"""
+
+    if cache is None:
+        cache = EligibilityCache()
+
     contraction_tree = ContractionTree(G)
 
+    # the contraction tree keeps G, so contract a copy of it in place
+    minor = G.copy()
+
     # while the graph has more than 3 nodes
-    while len(G) > 3:
+    while len(minor) > 3:
 
-        # get the eligible edge and the minor that results from contracting it
-        eu, ev, minor = _find_eligible_edge(G, cw, verbose=verbose)
+        # get the eligible edge, contracted in the minor
+        eu, ev = _find_eligible_edge(
+            minor, cw, verbose=verbose, cache=cache, pool=pool, workers=workers,
+            strategy=strategy,
+        )
+        minor.commit()
 
         if verbose:
             print("G\\%s selected" % ((eu, ev),))
 
-        G = minor
-
         contraction_tree.contract(eu, ev)
 
+    if verbose:
+        print(cache)
+
+    return _complete_carving(contraction_tree, minor)
+
+
+def _complete_carving(contraction_tree, minor):
+    """Contracts the last edges of 'minor' into the contraction tree and roots it"""
+
     # finish contracting the last 3 edges
-    contraction_tree.contract_remaining(G)
+    contraction_tree.contract_remaining(minor)
 
     # reroot the tree according to smallest edge in the carving C
     root = contraction_tree.reroot()
@@ -383,6 +1190,99 @@ def edge_contraction(G, cw, verbose=False):
     return contraction_tree
 
 
+def branching_edge_contraction(
+    G, cw, branches, fork_every=None, seed=None, strategy="random", verbose=False
+):
+    """Edge contraction for many carvings that share their first contractions
+
+    Rather than running edge_contraction() 'branches' times from scratch,
+    contracts a prefix of edges once, then forks it in two every
+    'fork_every' contractions until there are 'branches' carvings. At a
+    fork each branch starts with an edge its siblings did not take, and
+    goes on with its own seed, so the carvings do not depend on the order
+    they are consumed in. A branch finding no edge of its own is dropped.
+
+    The branches are walked depth first. The minor is snapshotted with
+    RGraph.copy() at each fork, sharing its faces and dual, and a branch's
+    contraction tree is rebuilt from the edges contracted along its path,
+    so memory grows with the number of forks on a path rather than with
+    the number of carvings.
+
+    Arguments:
+        G: the input RGraph object
+        cw: the carving width of the graph
+        branches: the number of carvings to make
+        fork_every: the number of contractions between forks. When None,
+            the forks are spread evenly over the contraction
+        seed: the seed of the carvings' edge orders
+        strategy: the order to try edges in, see selection_strategies
+        verbose: when true, prints the selected edge for contraction
+
+    Yields the contraction tree of each carving, and the EligibilityCache
+    counting the tests made on it since it branched off.
+    """
+
+    if fork_every is None:
+        forks = math.ceil(math.log2(branches)) if branches > 1 else 0
+        fork_every = max(1, (len(G) - 3) // (forks + 1))
+
+    seeder = rand.Random(seed)
+    # the caller's rng, handed back whenever a carving is yielded
+    state = rand.getstate()
+    # the edges contracted on the current branch
+    path = []
+
+    def branch(minor, leaves, cache, taken):
+        nonlocal state
+
+        rand.seed(seeder.getrandbits(64))
+        fork = len(path)
+
+        while len(minor) > 3 and (len(path) == fork or leaves == 1 or len(path) % fork_every):
+            try:
+                eu, ev = _find_eligible_edge(
+                    minor, cw, verbose=verbose, cache=cache, strategy=strategy,
+                    excluded=taken if len(path) == fork else (),
+                )
+            except NoContractibleEdgeException:
+                if len(path) == fork and taken:
+                    # every edge left would repeat a sibling
+                    return
+                raise
+
+            minor.commit()
+
+            if verbose:
+                print("G\\%s selected" % ((eu, ev),))
+
+            if len(path) == fork:
+                taken.append((eu, ev))
+            path.append((eu, ev))
+
+        if len(minor) > 3:
+            # fork the branch, the last fork taking over the minor itself
+            depth = len(path)
+            forked = []
+            shares = (leaves - leaves // 2, leaves // 2)
+            # fork the cache before either branch adds its own failures to it
+            caches = (cache, cache.fork(depth))
+            for i, (share, fork_cache) in enumerate(zip(shares, caches)):
+                yield from branch(minor if i else minor.copy(), share, fork_cache, forked)
+                del path[depth:]
+            return
+
+        contraction_tree = ContractionTree(G)
+        for eu, ev in path:
+            contraction_tree.contract(eu, ev)
+
+        rand.setstate(state)
+        yield _complete_carving(contraction_tree, minor), cache
+        state = rand.getstate()
+
+    yield from branch(G.copy(), branches, EligibilityCache(), [])
+    rand.setstate(state)
+
+
 def _log_binarysearchcw(le_pred, low, high, verbose=False):
     """
     Binary search to narrow down the carving width, for floating point edge weights.
@@ -438,20 +1338,23 @@ def _carving_width_found(low, high, return_cw=False):
         return False
 
 
-def _carving_width_bounds(G, low=None, high=None, verbose=False):
+def _carving_width_bounds(rc, low=None, high=None, verbose=False):
     """
     Finds the lowest integer i such that low < 2**i,
     returning bounds to be used by a binary search.
     Takes ≤ lg(cw) calls to the Ratcatcher.
     'low' is lower-bounded by the max-cutweight.
+
+    Arguments:
+        rc: the RatcatcherInstance of the graph
     """
 
     # the carving width must be at least the max cutweight of the graph
     if low is None:
-        low = max(G.cutweight(u) for u in G)
+        low = rc.max_cutweight
 
     # if the lower bound is equal to the initial max cutweight
-    if ratcatcher(G, low):
+    if rc.test(low):
         if verbose:
             print("k bound by initial cutweight: %s" % low)
         return (low, low)
@@ -469,7 +1372,7 @@ def _carving_width_bounds(G, low=None, high=None, verbose=False):
 
         # increase upper and lower bound by factors of 2
         # until the carving width falls somewhere in between
-        while not ratcatcher(G, high):
+        while not rc.test(high):
             if verbose:
                 print("k >= %d" % high)
             low = high
@@ -480,6 +1383,179 @@ def _carving_width_bounds(G, low=None, high=None, verbose=False):
         return (low, high)
 
 
+def _threshold_searchcw(rc, low, high, verbose=False):
+    """
+    Bisects over the distinct thresholds of the ratcatcher game in [low, high),
+    given that low ≤ cw < high, and returns the carving width exactly.
+
+    test(k) only changes when k passes a threshold, so a probe just above
+    each candidate (at the next threshold) decides it, and the search takes
+    ≈ lg(#thresholds) probes instead of converging on a floating-point value.
+    """
+
+    if low == high:
+        return low
+
+    candidates = rc.thresholds(low, high)
+    if verbose:
+        print("%d candidate thresholds in [%s,%s)" % (len(candidates), low, high))
+
+    # the smallest i such that cw < the next threshold after candidates[i],
+    # i.e. cw = candidates[i]; cw < high is already known
+    lo, hi = 0, len(candidates) - 1
+    i = 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        above = candidates[mid + 1]
+
+        if rc.test(above):
+            if verbose:
+                print("%d. " % i + "carving width ≤ " "{0:.10f}".format(candidates[mid]))
+            hi = mid
+        else:
+            if verbose:
+                print("%d. " % i + "carving width > " "{0:.10f}".format(candidates[mid]))
+            lo = mid + 1
+
+        i += 1
+
+    cw = candidates[lo]
+    if verbose:
+        print("carving-width = {0:.10f}".format(cw))
+
+    return float(cw)
+
+
+# the RatcatcherInstance a probe worker plays the game on, see _init_probe_worker()
+_probe_instance = None
+
+
+def _init_probe_worker(spec):
+    """Attaches a pool worker to a RatcatcherInstance in shared memory"""
+    global _probe_instance
+    _probe_instance = RatcatcherInstance.attach(spec)
+
+
+def _probe(k):
+    """Tests the worker's RatcatcherInstance against k"""
+    return _probe_instance.test(k)
+
+
+def _parallel_carving_width_bounds(rc, pool, workers, verbose=False):
+    """
+    Like _carving_width_bounds(), but tests the next 'workers' powers
+    of 2 at once on a pool of probe workers.
+    """
+
+    # the carving width is at least the max cutweight of the graph,
+    # which the ratcatcher always rejects
+    low = rc.max_cutweight
+
+    high = 2
+    while high <= low:
+        high *= 2
+    if verbose:
+        print("initial k guess: %d" % high)
+
+    while True:
+        probes = [high * 2 ** i for i in range(workers)]
+
+        for k, success in zip(probes, pool.map(_probe, probes)):
+            if success:
+                if verbose:
+                    print("k ∈ (%s,%s]" % (low, k))
+                return (low, k)
+
+            if verbose:
+                print("k >= %d" % k)
+            low = k
+
+        high = low * 2
+
+
+def _parallel_threshold_searchcw(rc, low, high, pool, workers, verbose=False):
+    """
+    Like _threshold_searchcw(), but a k-ary search: every round tests
+    'workers' evenly spaced thresholds at once on a pool of probe workers.
+    """
+
+    if low == high:
+        return low
+
+    candidates = rc.thresholds(low, high)
+    if verbose:
+        print("%d candidate thresholds in [%s,%s)" % (len(candidates), low, high))
+
+    lo, hi = 0, len(candidates) - 1
+    i = 1
+    while lo < hi:
+        # split [lo, hi) into workers + 1 parts
+        mids = sorted({
+            min(hi - 1, lo + (hi - lo) * j // (workers + 1)) for j in range(1, workers + 1)
+        })
+
+        results = pool.map(_probe, [candidates[mid + 1] for mid in mids])
+
+        # the results are monotone, so narrow to the first success
+        for mid, success in zip(mids, results):
+            if success:
+                hi = mid
+                break
+            lo = mid + 1
+
+        if verbose:
+            print("%d. " % i + "carving width ∈ [{0:.10f}, {1:.10f}]".format(
+                candidates[lo], candidates[hi])
+            )
+
+        i += 1
+
+    cw = candidates[lo]
+    if verbose:
+        print("carving-width = {0:.10f}".format(cw))
+
+    return float(cw)
+
+
+def _product_searchcw(rc, cw, verbose=False):
+    """
+    Finds the carving width of a graph with log weights exactly, as the
+    smallest integer bound with rc.test_product(bound), starting next to
+    the carving width cw found in floating point.
+
+    The floating point value is a sum of log weights, so 2**cw is within
+    rounding of the answer, and ≈ 2 exact probes confirm it.
+    """
+
+    bound = round(2.0 ** cw)
+
+    # gallop away from the guess until the answer is bracketed, as
+    # lo < answer ≤ hi, then bisect; no product is below 1
+    step = 1
+    if rc.test_product(bound):
+        lo, hi = bound - 1, bound
+        while lo > 0 and rc.test_product(lo):
+            hi, lo = lo, max(0, lo - step)
+            step *= 2
+    else:
+        lo, hi = bound, bound + 1
+        while not rc.test_product(hi):
+            lo, hi = hi, hi + step
+            step *= 2
+
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if rc.test_product(mid):
+            hi = mid
+        else:
+            lo = mid
+
+    if verbose:
+        print("carving-width = log2(%d)" % hi)
+
+    return hi
+
+
 def _binarysearchcw(le_pred, low, high):
     """
     Like log_binarysearchcw(), but searches for the carving-width of an integer-weighted graph that has not undergone logarithmic scaling.
@@ -514,27 +1590,75 @@ def apply_logweights(G):
     return G.apply_weights(lambda w: math.log(w, 2))
 
 
-def carving_width(H, logs=True, copy=False, verbose=True):
+def carving_width(
+    H,
+    logs=True,
+    copy=False,
+    verbose=True,
+    search="threshold",
+    use_walk_pred=False,
+    workers=1,
+    exact=False,
+):
     """
     Gets the carving width of the input graph G.
+
+    Arguments:
+        search: "threshold" to bisect over the distinct thresholds of the
+            ratcatcher game, or "bisect" to bisect over the value of k
+        use_walk_pred: when True, the ratcatcher prunes room states with a short walk
+        workers: the number of processes probing thresholds at once, in a
+            k-ary search. Only supported with search="threshold"
+        exact: when True, the carving width is returned as an exact integer,
+            the largest product of the weights across a cut, rather than its
+            log, see RatcatcherInstance.test_product(). Requires logs and
+            search="threshold"
     """
 
+    if workers > 1 and search != "threshold":
+        raise ValueError("parallel probes require search='threshold'")
+
+    if exact and not (logs and search == "threshold"):
+        raise ValueError("exact carving widths require logs and search='threshold'")
+
     G = H.copy() if copy else H
 
     if logs:
         G = apply_logweights(G)
 
-    D = G.dual()
+    # the planar dual, its shortest distances and the rest of the
+    # k-independent setup of the ratcatcher game, shared by every probe
+    rc = RatcatcherInstance(G, use_walk_pred=use_walk_pred)
+
+    if workers > 1:
+        cw = _parallel_carving_width(rc, workers, verbose=verbose)
 
-    # the shortest distances between all pairs of vertices in the dual graph, D/G*
-    dists = D.shortest_paths()
+        if exact:
+            return G, _product_searchcw(rc, cw, verbose=verbose)
+
+        # report it the same way as the bisections below
+        k = math.log(round(2.0 ** cw), 2) if logs else math.floor(cw) + 1
+
+        return G, k
 
     # the lower and upper bound on possible carving width
     # to be used in the binary search for true carving width
-    (low, high) = _carving_width_bounds(G, verbose=verbose)  # ≈lg(cw) calls
+    (low, high) = _carving_width_bounds(rc, verbose=verbose)  # ≈lg(cw) calls
+
+    if search == "threshold":
+        # find the carving width exactly, called ≈ lg(#thresholds) times
+        cw = _threshold_searchcw(rc, low, high, verbose=verbose)
+
+        if exact:
+            return G, _product_searchcw(rc, cw, verbose=verbose)
+
+        # report it the same way as the bisections below
+        k = math.log(round(2.0 ** cw), 2) if logs else math.floor(cw) + 1
+
+        return G, k
 
     # a lambda that applies the ratcatcher function to G with a candidate carving width <= m
-    pred = lambda m: ratcatcher(G, m)
+    pred = lambda m: rc.test(m)
 
     # find the carving width, called ≈ lg(cw) + cw times
     k = (
@@ -544,3 +1668,24 @@ def carving_width(H, logs=True, copy=False, verbose=True):
     )
 
     return G, k
+
+
+def _parallel_carving_width(rc, workers, verbose=False):
+    """
+    Finds the carving width of the graph of a RatcatcherInstance with a
+    pool of 'workers' processes, sharing the instance's arrays through
+    shared memory rather than pickling them for every probe.
+    """
+    import multiprocessing
+
+    blocks, spec = rc.share()
+    pool = multiprocessing.Pool(workers, initializer=_init_probe_worker, initargs=(spec,))
+
+    try:
+        (low, high) = _parallel_carving_width_bounds(rc, pool, workers, verbose=verbose)
+        return _parallel_threshold_searchcw(rc, low, high, pool, workers, verbose=verbose)
+    finally:
+        pool.terminate()
+        for block in blocks:
+            block.close()
+            block.unlink()
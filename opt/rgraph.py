@@ -1,5 +1,3 @@
-import opt.contraction as contraction
-
 import opt.graph as gr
 import networkx as nx
 
@@ -16,6 +14,8 @@ class RGraph(nx.Graph):
         distances: a mapping from vertex pair to the distance of the shortest path between them
         id: the graph id
         name: the graph name
+        journal: the contractions made in place and not yet committed,
+            see contract()
     """
     def __init__(self, *args, **kwargs):
         super(RGraph, self).__init__(*args, **kwargs)
@@ -25,12 +25,20 @@ class RGraph(nx.Graph):
         self.cutweights = None
         self.id = None
         self.name = None
+        self._face_origins = None
+        self._vertex_faces = None
+        self._biconnected = None
+        self._contracted_dual = None
+        self.journal = []
 
     def copy(self):
         new = RGraph(self)
         new._faces = self._faces
         new._dual = self._dual
-        new.cutweights = self.cutweights
+        new.cutweights = None if self.cutweights is None else dict(self.cutweights)
+        new._face_origins = self._face_origins
+        new._biconnected = self._biconnected
+        new._contracted_dual = self._contracted_dual
         return new
 
     def add_edge(self, v1, v2, weight, *args, **kwargs):
@@ -55,12 +63,92 @@ class RGraph(nx.Graph):
 
         return cutweights
 
-    def get_candidate(self, eu, ev):
-        """Contract two nodes in the context of the ratcatcher and return the result"""
-        candidate = contraction.contracted_nodes(
-            self, eu, ev, ratcatcher=True, copy=True
+    def contract(self, u, v):
+        """Contract the edge (u,v) into u in place, in the context of the ratcatcher
+
+        The weights of the edges u and v have to a common neighbour are
+        summed, and v is removed.
+        Only the cutweight of u changes. The faces and biconnectivity of the
+        minor are derived from those of self, and its dual distances from
+        self's when first needed.
+
+        The contraction is recorded in the journal, so that undo() can
+        revert it. commit() keeps the contractions made so far.
+        """
+
+        # what the minor derives from self, before self changes
+        derived = self._contract_faces(u, v)
+        biconnected = (
+            self._contraction_is_biconnected(u, v)
+            if len(self) > 3 and self.is_biconnected()
+            else None
+        )
+        contracted_dual = (self.dual(), (u, v)) if derived is not None else None
+
+        state = (
+            self._faces, self._embedding, self._dual, self._vertex_faces, self._biconnected,
+            self._face_origins, self._contracted_dual,
+            None if self.cutweights is None else (self.cutweights[u], self.cutweights[v]),
         )
-        return RGraph(candidate)
+
+        # sum the weights of the edges to common neighbours
+        common = [(w, self[u][w]["weight"]) for w in nx.common_neighbors(self, u, v)]
+        for w, weight in common:
+            self[u][w]["weight"] = weight + self[v][w]["weight"]
+
+        # move the other edges of v to u
+        v_node = self.nodes[v]
+        v_edges = list(self[v].items())
+        moved = [x for x, _ in v_edges if x != u and x not in self[u]]
+
+        super(RGraph, self).remove_node(v)
+        super(RGraph, self).add_edges_from((u, x, d) for x, d in v_edges if x in moved)
+
+        if self.cutweights is not None:
+            del self.cutweights[v]
+            self._init_cutweight(u)
+
+        self._faces, self._face_origins = derived if derived is not None else (None, None)
+        self._embedding = None
+        self._dual = None
+        self._vertex_faces = None
+        self._biconnected = biconnected
+        self._contracted_dual = contracted_dual
+
+        self.journal.append((u, v, v_node, v_edges, common, moved, state))
+
+        return self
+
+    def undo(self):
+        """Revert the last contraction in the journal, see contract()"""
+
+        u, v, v_node, v_edges, common, moved, state = self.journal.pop()
+
+        for x in moved:
+            super(RGraph, self).remove_edge(u, x)
+
+        super(RGraph, self).add_node(v, **v_node)
+        super(RGraph, self).add_edges_from((v, x, d) for x, d in v_edges)
+
+        for w, weight in common:
+            self[u][w]["weight"] = weight
+
+        (
+            self._faces, self._embedding, self._dual, self._vertex_faces, self._biconnected,
+            self._face_origins, self._contracted_dual, cutweights,
+        ) = state
+
+        if cutweights is None:
+            self.cutweights = None
+        else:
+            self.cutweights[u], self.cutweights[v] = cutweights
+
+        return self
+
+    def commit(self):
+        """Keep the contractions made in place so far, see contract()"""
+        self.journal.clear()
+        return self
 
     def cutweight(self, vertex):
         """Calculate the cutweight of the vertex"""
@@ -85,8 +173,97 @@ class RGraph(nx.Graph):
 
             self._dual = dual.Dual(self)
 
+            # a minor whose faces were derived from those of the graph it was
+            # contracted from only needs the distances that the contraction changed
+            if self._contracted_dual is not None:
+                parent_dual, edge = self._contracted_dual
+                self._dual.contract_distances(parent_dual, edge, self._face_origins)
+
+            # let go of the parent's dual, once done with it
+            self._face_origins = None
+            self._contracted_dual = None
+
         return self._dual
 
+    def is_biconnected(self):
+        """Whether self is biconnected
+
+        For a minor contracted in place from a biconnected graph, see
+        contract(), this was answered from the faces around the contracted edge.
+        """
+        if self._biconnected is None:
+            self._biconnected = nx.is_biconnected(self)
+
+        return self._biconnected
+
+    def _contraction_is_biconnected(self, eu, ev):
+        """Whether contracting the edge (eu,ev) of self leaves it biconnected
+
+        Self must be biconnected, with at least 4 vertices. Every vertex
+        but the merged one stays a non-cut vertex, and the merged one is a
+        cut vertex exactly when {eu,ev} separates self. In a plane graph
+        that happens exactly when a face other than the two on either side
+        of the edge contains both eu and ev.
+        """
+        if self._vertex_faces is None:
+            vertex_faces = {u: set() for u in self}
+            for i, face in enumerate(self.faces()):
+                for u, _ in face:
+                    vertex_faces[u].add(i)
+            self._vertex_faces = vertex_faces
+
+        return len(self._vertex_faces[eu] & self._vertex_faces[ev]) == 2
+
+    def _contract_faces(self, eu, ev):
+        """Derives the faces of self with the edge (eu,ev) contracted into eu.
+
+        Contracting an edge removes it from the two faces incident to it,
+        and relabels ev to eu everywhere else. A triangle face incident to
+        the edge becomes a pair of parallel edges, which are merged, and
+        the face disappears. The faces keep the order they have in self.
+
+        Returns the faces of the minor, in the format of faces(), and the
+        index in faces() of the face of self each one came from. Returns
+        None when the contraction changes the faces in any other way, i.e.
+        when the edge is a bridge, or eu and ev have a common neighbour
+        they do not share a triangle face with.
+        """
+
+        faces = self.faces()
+        contracted = {(eu, ev), (ev, eu)}
+
+        incident = [face for face in faces if contracted & set(face)]
+        if len(incident) != 2:
+            return None
+
+        # the common neighbours whose merged edges bound a triangle face
+        triangles = {
+            v for face in incident if len(face) == 3 for edge in face for v in edge
+        } - {eu, ev}
+        if triangles != set(nx.common_neighbors(self, eu, ev)):
+            return None
+
+        new_faces = []
+        origins = []
+        for i, face in enumerate(faces):
+            new_face = [
+                (eu if u == ev else u, eu if v == ev else v)
+                for u, v in face
+                if (u, v) not in contracted
+            ]
+
+            if len(new_face) < 3:
+                continue
+
+            # a face bounding a merged edge on both sides
+            if len(set(self._order_edges(new_face))) != len(new_face):
+                return None
+
+            new_faces.append(new_face)
+            origins.append(i)
+
+        return new_faces, origins
+
     def edge_weights(self):
         """Returns the edge weights of self"""
         return gr.edge_weights(self)
@@ -102,6 +279,8 @@ class RGraph(nx.Graph):
 
     def _update(self):
         self._init_cutweights()
+        self._face_origins = None
+        self._contracted_dual = None
 
     def _order_edges(self, edges):
         """Orders nodes within edges by node id ascending"""
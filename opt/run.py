@@ -1,13 +1,14 @@
 import click
 
 import random as rand
+import statistics
 import networkx as nx
 
 import opt.data as data
 
 from opt.rgraph import RGraph
 from opt.generate import gen_tests
-from opt.ratcatcher import ratcatcher, apply_logweights
+from opt.ratcatcher import ratcatcher, apply_logweights, selection_strategies
 
 
 @click.group()
@@ -162,10 +163,68 @@ def gaussian(minL, maxL, n, out, seed, max_cw):
     show_default=True,
     help="a flag to write results for intermediate edge-contraction results",
 )
-def ratcon(in_dir, out_dir, file_format, num_edge_contractions, seed, write, write_piecemeal):
+@click.option(
+    "--workers",
+    default=1,
+    show_default=True,
+    help="the number of processes searching for the carving width and running edge contractions; results do not depend on it",
+)
+@click.option(
+    "--time-budget",
+    type=float,
+    default=None,
+    help="seconds to spend on each graph, running edge contractions until they run out "
+    "instead of --num-edge-contractions times; improvements are streamed to the "
+    "piecemeal results as they are found",
+)
+@click.option(
+    "--strategy",
+    default="random",
+    show_default=True,
+    type=click.Choice(list(selection_strategies)),
+    help="the order edge contraction tries edges in",
+)
+@click.option(
+    "--branching",
+    type=bool,
+    default=False,
+    show_default=True,
+    help="share the first contractions of the edge contractions, forking "
+    "them off each other into a tree of --num-edge-contractions carvings",
+)
+@click.option(
+    "--fork-every",
+    type=int,
+    default=None,
+    help="when branching, the number of contractions between forks "
+    "(default: spread evenly)",
+)
+def ratcon(
+    in_dir,
+    out_dir,
+    file_format,
+    num_edge_contractions,
+    seed,
+    write,
+    write_piecemeal,
+    workers,
+    time_budget,
+    strategy,
+    branching,
+    fork_every,
+):
     rand.seed(seed)
 
-    ratcon_runner = data.RatconResultsAggregator(out_dir, num_edge_contractions)
+    ratcon_runner = data.RatconResultsAggregator(
+        out_dir,
+        num_edge_contractions,
+        workers=workers,
+        time_budget=time_budget,
+        stream=write_piecemeal,
+        strategy=strategy,
+        branching=branching,
+        fork_every=fork_every,
+    )
 
     graph_container = data.GraphContainer()
     graph_container.add_graphs(in_dir, file_format)
@@ -178,6 +237,128 @@ def ratcon(in_dir, out_dir, file_format, num_edge_contractions, seed, write, wri
         ratcon_runner.write_piecemeal()
 
 
+@cli.command(help="compare ratcon's edge selection strategies on a set of graphs")
+@click.option(
+    "--in", "in_dir", required=True, help="the directory containing the test graphs"
+)
+@click.option(
+    "--format",
+    "file_format",
+    required=True,
+    type=click.Choice(["gpickle", "ew"]),
+    help="the type of file representing the test graphs",
+)
+@click.option(
+    "--out", "out_dir", required=True, help="where to generate/store the results"
+)
+@click.option(
+    "--num-edge-contractions",
+    default=1,
+    help="the number of times to run the edge-contraction algorithm",
+)
+@click.option(
+    "--rng",
+    "seed",
+    required=False,
+    type=int,
+    default=1,
+    help="rng seed, shared by every strategy"
+)
+@click.option(
+    "--workers",
+    default=1,
+    show_default=True,
+    help="the number of processes running carvings in parallel",
+)
+@click.option(
+    "--strategy",
+    "strategies",
+    multiple=True,
+    type=click.Choice(list(selection_strategies)),
+    help="a strategy to compare, may be repeated (default: all of them)",
+)
+def ratcon_strategies(in_dir, out_dir, file_format, num_edge_contractions, seed, workers, strategies):
+    graph_container = data.GraphContainer()
+    graph_container.add_graphs(in_dir, file_format)
+
+    data.compare_strategies(
+        graph_container,
+        num_edge_contractions,
+        out_dir,
+        strategies or list(selection_strategies),
+        seed=seed,
+        workers=workers,
+    )
+
+
+@cli.command(help="time the evaluation of random contraction sequences on a set of graphs")
+@click.option(
+    "--in", "in_dir", required=True, help="the directory containing the test graphs"
+)
+@click.option(
+    "--format",
+    "file_format",
+    required=True,
+    type=click.Choice(["gpickle", "ew"]),
+    help="the type of file representing the test graphs",
+)
+@click.option(
+    "--num-sequences",
+    default=100,
+    show_default=True,
+    help="the number of sequences to evaluate on each graph",
+)
+@click.option(
+    "--rng",
+    "seed",
+    required=False,
+    type=int,
+    default=1,
+    help="rng seed"
+)
+@click.option(
+    "--evaluator",
+    type=bool,
+    default=False,
+    show_default=True,
+    help="time the compiled ordering evaluator used by gencon instead of contract_fast",
+)
+@click.option(
+    "--batch",
+    type=bool,
+    default=False,
+    show_default=True,
+    help="time contract_batch on the sequences a population at a time, as gencon does for large populations",
+)
+@click.option(
+    "--population",
+    "populations",
+    multiple=True,
+    type=int,
+    default=(100, 1000, 10000),
+    show_default=True,
+    help="with --batch True, the population sizes to sweep, each timed on at least that many sequences",
+)
+def bench_contract(in_dir, file_format, num_sequences, seed, evaluator, batch, populations):
+    graph_container = data.GraphContainer()
+    graph_container.add_graphs(in_dir, file_format)
+
+    for population in populations if batch else [None]:
+        if population:
+            print(f"population {population}:")
+        throughput = data.contract_fast_throughput(
+            graph_container,
+            max(num_sequences, population or 0),
+            seed=seed,
+            evaluator=evaluator,
+            batch=batch,
+            population=population,
+        )
+        for name, sequences_per_second in throughput.items():
+            print(f"{name}: {sequences_per_second:.1f} sequences/s")
+        print(f"mean: {statistics.mean(throughput.values()):.1f} sequences/s")
+
+
 @cli.command(help="optimize tensor networks with genetic algorithms")
 @click.option(
     "--in", "in_dir", required=True, help="the directory containing the test graphs"
@@ -20,10 +20,12 @@ setup(
         'matplotlib==2.2.2;implementation_name != "pypy"',
         'scipy>=1.3.1;implementation_name != "pypy"'
     ],
-    python_requires='>=3.6.1',
+    python_requires='>=3.8',
     entry_points = {
         'console_scripts': [
             'ratcon=opt.run:ratcon',
+            'ratcon-strategies=opt.run:ratcon_strategies',
+            'bench-contract=opt.run:bench_contract',
             'netcon=opt.run:netcon',
             'gencon=opt.run:gencon',
             'test-gen=opt.run:generate_tests'
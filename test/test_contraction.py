@@ -0,0 +1,124 @@
+import math
+import random
+import sys
+
+import networkx as nx
+import pytest
+
+from opt.ratcatcher import carving_width, edge_contraction
+from opt.contraction import (
+    DisjointSet,
+    OrderingEvaluator,
+    contract_batch,
+    contract_fast,
+)
+from opt.rgraph import RGraph
+from opt.util import is_close
+
+
+def weighted_lattice(rows, columns, seed=1, weights=(2, 64)):
+    """A rows × columns lattice with random integer weights, as the lognormal graphs"""
+    rng = random.Random(seed)
+    G = nx.convert_node_labels_to_integers(nx.grid_2d_graph(rows, columns))
+    for u, v in G.edges():
+        G[u][v]["weight"] = rng.randint(*weights)
+    return G
+
+
+def test_disjoint_set():
+    contracted = DisjointSet(range(10))
+
+    # the example of the docstring: 2 resolves to 8 through 1 and 7
+    for u, v in [(1, 2), (7, 1), (8, 7)]:
+        contracted.union(u, v)
+    assert [contracted.find(u) for u in (1, 2, 7, 8)] == [8] * 4
+
+    # a small set absorbing a larger one keeps its name, though not the root
+    contracted.union(9, 2)
+    assert contracted.find(2) == 9
+    assert contracted._root(2) != 9
+    assert contracted.find(3) == 3
+
+
+def test_ordering_evaluator():
+    rng = random.Random(1)
+    for seed in range(3):
+        graph = weighted_lattice(5, 6, seed=seed)
+        evaluator = OrderingEvaluator(graph)
+        edges = list(graph.edges())
+
+        # repeats are self-loops by the time they come round again
+        indices = rng.sample(range(len(edges)), len(edges)) + [0, 1]
+        floats = [(i, 0.0) for i in indices]
+        expected = contract_fast(graph, edges, floats=floats)[0]
+        assert evaluator.cost(indices) == expected
+        assert evaluator.pair_cost([edges[i] for i in indices]) == expected
+        log_evaluator = OrderingEvaluator(graph, log=True)
+        assert is_close(log_evaluator.cost(indices), math.log2(expected), 1e-9)
+
+        # and orderings of carvings pair the vertices of bags
+        g, cw = carving_width(RGraph(graph), verbose=False)
+        ordering = edge_contraction(g.copy(), cw).ordering()
+        assert evaluator.pair_cost(ordering) == contract_fast(graph, ordering)[0]
+
+
+def test_contract_batch():
+    rng = random.Random(1)
+    graph = weighted_lattice(5, 6)
+    evaluator = OrderingEvaluator(graph)
+    num_edges = graph.number_of_edges()
+
+    orderings = [rng.sample(range(num_edges), num_edges) + [0, 1] for _ in range(20)]
+    costs = [evaluator.cost(ordering) for ordering in orderings]
+    for batch_cost, ct in zip(contract_batch(graph, orderings), costs):
+        assert is_close(batch_cost, ct, 1e-12 * ct)
+    for log_cost, ct in zip(contract_batch(graph, orderings, log=True), costs):
+        assert is_close(log_cost, math.log2(ct), 1e-9)
+
+
+def test_log_contract_fast():
+    rng = random.Random(1)
+    graph = weighted_lattice(5, 6)
+    edges = list(graph.edges())
+    ordering = rng.sample(edges, len(edges)) + edges[:2]
+
+    ct, _ = contract_fast(graph, ordering)
+    log_ct, _ = contract_fast(graph, ordering, log=True)
+    assert is_close(log_ct, math.log2(ct), 1e-9)
+    assert contract_fast(graph, ordering, log=True, exact=True)[0] == ct
+    with pytest.raises(ValueError):
+        contract_fast(graph, ordering, exact=True)
+
+    # integer weights whose Ct overflows a float
+    for u, v in graph.edges():
+        graph[u][v]["weight"] **= 40
+    ct, _ = contract_fast(graph, ordering)
+    assert ct > sys.float_info.max
+    assert is_close(contract_fast(graph, ordering, log=True)[0], math.log2(ct), 1e-9)
+
+
+def test_log_float_weights():
+    rng = random.Random(1)
+    graph = weighted_lattice(5, 6)
+    edges = list(graph.edges())
+    indices = rng.sample(range(len(edges)), len(edges))
+    ordering = [edges[i] for i in indices]
+    log_ct, _ = contract_fast(graph, ordering, log=True)
+
+    # float weights whose products overflow to inf, but whose log2 do not
+    scale = 2.0 ** 300
+    for u, v in graph.edges():
+        graph[u][v]["weight"] *= scale
+    assert contract_fast(graph, ordering)[0] == math.inf
+    assert not math.isfinite(OrderingEvaluator(graph).cost(indices))
+    with pytest.warns(RuntimeWarning, match="overflow"):
+        assert contract_batch(graph, [indices])[0] == math.inf
+
+    # each contraction's cost gains 300 per weight in its cut
+    scaled = [
+        contract_fast(graph, ordering, log=True)[0],
+        OrderingEvaluator(graph, log=True).cost(indices),
+        contract_batch(graph, [indices], log=True)[0],
+    ]
+    assert all(math.isfinite(log_scaled) and log_scaled > log_ct + 300 for log_scaled in scaled)
+    assert is_close(scaled[0], scaled[1], 1e-9) and is_close(scaled[0], scaled[2], 1e-9)
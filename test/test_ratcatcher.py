@@ -3,7 +3,9 @@ import os
 import cProfile
 import networkx as nx
 import multiprocessing
-from opt.ratcatcher import carving_width, ratcatcher
+import pytest
+from opt.ratcatcher import RatcatcherInstance, apply_logweights, carving_width, ratcatcher
+from opt.contraction import contracted_nodes
 from opt.rgraph import RGraph
 
 
@@ -104,7 +106,26 @@ def test_custom():
     assert cw_G2 == 4
 
 
-def hicks_helper(graph_name, ground_truth_bw):
+def test_exact_carving_width():
+    # the graph of test_custom(), whose cuts of carving width 4 hold 4 edges
+    G = nx.Graph()
+    for u, v in [(1, 2), (2, 3), (3, 4), (4, 5), (5, 1), (1, 6), (2, 7), (3, 8),
+                 (4, 9), (5, 10), (6, 7), (7, 8), (8, 9), (9, 10), (10, 6)]:
+        G.add_edge(u, v, weight=3)
+
+    _, k = carving_width(RGraph(G), verbose=False, exact=True)
+    assert k == 3 ** 4
+
+    rc = RatcatcherInstance(apply_logweights(RGraph(G)))
+    assert rc.test_product(81) and not rc.test_product(80)
+    assert rc.product_tests == {81: True, 80: False}
+
+    # products of 2**60 are too close for double precision
+    with pytest.raises(ValueError):
+        rc.test_product(2 ** 60)
+
+
+def hicks_helper(graph_name, ground_truth_bw, **kwargs):
     print(f"Testing {graph_name}.")
     # read in the graph
     G = read_del("data/hicks/Delaunay/Delaunay/" + graph_name + ".tsp.del")
@@ -117,12 +138,103 @@ def hicks_helper(graph_name, ground_truth_bw):
     cw = ground_truth_bw * 2
     ep = 1e-8
 
-    ge_cw = not ratcatcher(M, cw)
-    lt_cw_plus_ep = ratcatcher(M, cw+ep)
+    ge_cw = not ratcatcher(M, cw, **kwargs)
+    lt_cw_plus_ep = ratcatcher(M, cw+ep, **kwargs)
 
     assert ge_cw and lt_cw_plus_ep, f'cw >= {cw}:{ge_cw}, cw < {cw}: {lt_cw_plus_ep}'
 
 
+def test_contracted_dual():
+    G = RGraph(read_del("data/hicks/Delaunay/Delaunay/eil51.tsp.del"))
+    G.dual().distance_matrix()
+
+    derived = 0
+    for eu, ev in list(G.edges())[:15]:
+        G.contract(eu, ev)
+        derived += G.dual()._distance_matrix is not None
+
+        # the game on the derived dual has the same outcome as on a fresh copy
+        fresh = RGraph(nx.Graph(G))
+        for k in range(140, 180, 5):
+            assert ratcatcher(G, k) == ratcatcher(fresh, k)
+
+        G.undo()
+
+    assert derived
+
+
+def test_contract_distances():
+    G = RGraph(read_del("data/hicks/Delaunay/Delaunay/eil51.tsp.del"))
+    G.dual().distance_matrix()
+
+    # contract a chain of edges, each minor's distances derived from the last's
+    for _ in range(15):
+        eu, ev = next(iter(G.edges()))
+        G.contract(eu, ev)
+        G.commit()
+
+        D = G.dual()
+        assert D._distance_matrix is not None
+
+        # the updated matrix matches a fresh all-pairs computation on the same dual
+        full = dict(nx.all_pairs_dijkstra_path_length(D))
+        for u, row in full.items():
+            for v, d in row.items():
+                assert abs(D.distance_matrix()[u, v] - d) < 1e-9
+
+
+def test_contracted_biconnectivity():
+    G = RGraph(read_del("data/hicks/Delaunay/Delaunay/eil51.tsp.del"))
+
+    # contract down to a small graph, where contractions start to
+    # leave cut vertices, checking every edge along the way
+    separating = 0
+    while len(G) > 4:
+        biconnected = []
+        for eu, ev in list(G.edges()):
+            G.contract(eu, ev)
+            assert G.is_biconnected() == nx.is_biconnected(G)
+            if G.is_biconnected():
+                biconnected.append((eu, ev))
+            else:
+                separating += 1
+            G.undo()
+
+        G.contract(*biconnected[len(biconnected) // 2])
+        G.commit()
+
+    assert separating
+
+
+def test_contract_undo():
+    G = RGraph(read_del("data/hicks/Delaunay/Delaunay/eil51.tsp.del"))
+    G.dual()
+
+    edges = {frozenset(e): w for *e, w in G.edges(data="weight")}
+    cutweights = {u: G.cutweight(u) for u in G}
+
+    for eu, ev in list(G.edges())[:20]:
+        candidate = RGraph(contracted_nodes(G, eu, ev, ratcatcher=True, copy=True))
+
+        # contracting in place gives the same minor as a networkx contraction
+        G.contract(eu, ev)
+        assert sorted(G.edges(data="weight")) == sorted(candidate.edges(data="weight"))
+        assert G.cutweights == {u: candidate.cutweight(u) for u in candidate}
+        assert G.is_biconnected() == nx.is_biconnected(candidate)
+        assert ratcatcher(G, 160) == ratcatcher(candidate, 160)
+
+        # and undoing it gives back G
+        G.undo()
+        assert {frozenset(e): w for *e, w in G.edges(data="weight")} == edges
+        assert G.cutweights == cutweights
+        assert not G.journal
+
+
+def test_walk_pred():
+    hicks_helper("eil51", 8, use_walk_pred=True)
+    hicks_helper("pr226", 7, use_walk_pred=True)
+    hicks_helper("tsp225", 12, use_walk_pred=True)
+
 def test_eil51():
     hicks_helper("eil51", 8)
 
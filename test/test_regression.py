@@ -1,13 +1,40 @@
 import opt.data as data
 
-from opt.ratcatcher import carving_width
+import random
+
+import networkx as nx
+import pytest
+
+from opt.ratcatcher import (
+    EligibilityCache,
+    branching_edge_contraction,
+    carving_width,
+    edge_contraction,
+    ratcatcher,
+    selection_strategies,
+    zero_epsilon,
+    _is_safe_contraction,
+)
+from opt.contraction import ContractionTree, contract_fast
 from opt.util import is_close
 
-def test_regression():
-    ratcon_runner = data.RatconResultsAggregator('/tmp', 1)
 
+@pytest.fixture(scope="module")
+def l7_graphs():
+    """The lognormal L7 graphs, loaded once per module. Copy before mutating."""
     graph_container = data.GraphContainer()
     graph_container.add_graphs('data/lognormal/L7', 'ew')
+    return list(graph_container.graphs())
+
+
+@pytest.fixture(scope="module")
+def l7_carving(l7_graphs):
+    """The first L7 graph as an RGraph, and its carving width"""
+    return carving_width(l7_graphs[0].copy(), verbose=False)
+
+
+def test_regression(l7_graphs):
+    ratcon_runner = data.RatconResultsAggregator('/tmp', 1)
 
     regressed = {}
 
@@ -16,7 +43,223 @@ def test_regression():
             name, cw, ct = graph_info.split(',')
             regressed[name] = cw
 
-    for graph in graph_container.graphs():
-        _, cw = carving_width(graph, verbose=False)
+    for graph in l7_graphs:
+        _, cw = carving_width(graph.copy(), verbose=False)
         old_cw = float(regressed[graph.name])
-        assert is_close(old_cw, cw, 1e-14), f"Carving width mismatch on {graph.name} -- {old_cw} -> {cw}"    
\ No newline at end of file
+        assert is_close(old_cw, cw, 1e-14), f"Carving width mismatch on {graph.name} -- {old_cw} -> {cw}"    
+
+def test_threshold_search(l7_graphs):
+    for graph in l7_graphs:
+        _, threshold_cw = carving_width(graph.copy(), verbose=False, search="threshold")
+        _, bisect_cw = carving_width(graph.copy(), verbose=False, search="bisect")
+        assert threshold_cw == bisect_cw, f"Search mismatch on {graph.name} -- {bisect_cw} -> {threshold_cw}"
+
+
+def test_parallel_search(l7_graphs):
+    for graph in l7_graphs[:5]:
+        _, serial_cw = carving_width(graph.copy(), verbose=False)
+        _, parallel_cw = carving_width(graph.copy(), verbose=False, workers=3)
+        assert serial_cw == parallel_cw, f"Search mismatch on {graph.name} -- {serial_cw} -> {parallel_cw}"
+
+
+def test_parallel_edge_contraction(l7_graphs):
+    for graph in l7_graphs[:3]:
+        g, cw = carving_width(graph.copy(), verbose=False)
+
+        orderings, counts = [], []
+        for workers in (1, 2):
+            random.seed(1)
+            cache = EligibilityCache()
+            orderings.append(edge_contraction(g.copy(), cw, cache=cache, workers=workers).ordering())
+            counts.append((cache.tests, cache.safe, cache.cutweight_rejections, cache.avoided))
+
+        assert orderings[0] == orderings[1], f"Carving mismatch on {graph.name}"
+        assert counts[0] == counts[1], f"Statistics mismatch on {graph.name}"
+
+
+def _carving_width_of(g, tree):
+    """The width of the carving 'tree' of g, after checking it is one"""
+    assert len(tree.ordering()) == g.number_of_nodes() - 1, "nodes left uncontracted"
+
+    # every tree node's bag is split between its children,
+    # down to a leaf per vertex
+    nodes = tree._preorder(tree.current_root)
+    assert tree.bag(tree.current_root) == frozenset(g)
+    assert sum(tree.left_child[node] < 0 for node in nodes) == g.number_of_nodes()
+    for node in nodes:
+        left, right = tree.left_child[node], tree.right_child[node]
+        if left >= 0:
+            assert not tree.bag(left) & tree.bag(right)
+            assert tree.bag(node) == tree.bag(left) | tree.bag(right)
+
+    # the width is the largest cut of a bag
+    return max(
+        sum(w for u, v, w in g.edges(data="weight") if (u in bag) != (v in bag))
+        for bag in map(tree.bag, nodes)
+    )
+
+
+def test_selection_strategies(l7_graphs):
+    for graph in l7_graphs:
+        g, cw = carving_width(graph.copy(), verbose=False)
+
+        random.seed(1)
+        default_width = _carving_width_of(g, edge_contraction(g.copy(), cw))
+        assert is_close(default_width, cw, 1e-9), f"default strategy on {graph.name}"
+
+        # every strategy finds a carving of the same, optimal, width
+        for strategy in selection_strategies:
+            random.seed(1)
+            tree = edge_contraction(g.copy(), cw, strategy=strategy)
+            width = _carving_width_of(g, tree)
+            assert is_close(width, default_width, 1e-9), f"{strategy} on {graph.name} -- {default_width} -> {width}"
+
+
+def test_safe_contractions(l7_graphs):
+    for graph in l7_graphs[:3]:
+        g, cw = carving_width(graph.copy(), verbose=False)
+
+        # every biconnected safe contraction passes the ratcatcher
+        safe = 0
+        for eu, ev in list(g.edges()):
+            if _is_safe_contraction(g, eu, ev):
+                g.contract(eu, ev)
+                if g.is_biconnected():
+                    safe += 1
+                    assert ratcatcher(g, cw + zero_epsilon), f"{(eu, ev)} of {graph.name}"
+                g.undo()
+
+        assert safe
+
+
+def test_eligibility_cache(l7_carving):
+    g = l7_carving[0].copy()
+
+    eu, ev = next(iter(g.edges()))
+    near = set(g[eu]) | set(g[ev])
+    far = next((x, y) for x, y in g.edges() if not {x, y} & near)
+    touching = next((eu, z) for z in g[eu] if z != ev)
+
+    cache = EligibilityCache()
+    cache.fail(g, eu, ev)
+    assert cache.partition(g, [(eu, ev)]) == ([], [(eu, ev)])
+
+    # a contraction away from the edge leaves it deferred
+    g.contract(*far)
+    g.commit()
+    assert cache.partition(g, [(eu, ev)]) == ([], [(eu, ev)])
+
+    # one that changes its neighbourhood has it retried first
+    g.contract(*touching)
+    g.commit()
+    assert cache.partition(g, [(eu, ev)]) == ([(eu, ev)], [])
+    assert cache.hits == 2
+
+    # a fork starts from the failures so far, and counts its own
+    other = next(e for e in g.edges() if frozenset(e) not in cache.failed)
+    fork = cache.fork(3)
+    fork.fail(g, *other)
+    assert fork.shared == 3 and frozenset((eu, ev)) in fork.failed
+    assert frozenset(other) not in cache.failed
+
+
+def test_branching_edge_contraction(l7_carving):
+    g, cw = l7_carving
+
+    random.seed(1)
+    state = random.getstate()
+
+    runs = []
+    for _ in range(2):
+        runs.append([
+            (carving.ordering(), cache.shared)
+            for carving, cache in branching_edge_contraction(g.copy(), cw, 5, seed=1)
+        ])
+
+    # the caller's rng is left alone, and the tree is the same each time
+    assert random.getstate() == state
+    assert runs[0] == runs[1]
+
+    orderings = [ordering for ordering, _ in runs[0]]
+    assert len(orderings) == 5
+    assert all(len(ordering) == g.number_of_nodes() - 1 for ordering in orderings)
+    assert [shared for _, shared in runs[0]][0] == 0
+    assert all(shared > 0 for _, shared in runs[0][1:])
+
+
+def test_contraction_tree(l7_carving):
+    g, cw = l7_carving
+    tree = edge_contraction(g.copy(), cw)
+
+    # every tree node's bag is its children's
+    assert tree.bag(tree.current_root) == frozenset(g)
+    for node in tree.tree_nodes:
+        if tree.left_child[node] >= 0:
+            left, right = tree.left_child[node], tree.right_child[node]
+            assert tree.bag(node) == tree.bag(left) | tree.bag(right)
+
+    # and, before rerooting, its Cspace is their cut
+    unrooted = ContractionTree(g)
+    for node in tree.tree_nodes:
+        unrooted.contract(*tree.history[node])
+    unrooted._set_tree(unrooted.current_root)
+
+    for node in unrooted.tree_nodes:
+        bag = unrooted.bag(node)
+        cut = sum(w for u, v, w in g.edges(data="weight") if (u in bag) != (v in bag))
+        assert is_close(unrooted.cs[node], cut, 1e-9)
+
+    # a caterpillar deeper than the recursion limit
+    path = nx.path_graph(5000)
+    nx.set_edge_attributes(path, 1, "weight")
+    tree = ContractionTree(path)
+    for v in range(1, 4998):
+        tree.contract(0, v)
+    tree.contract_remaining(nx.Graph([(0, 4998, {"weight": 1}), (4998, 4999, {"weight": 1})]))
+    tree._set_tree(tree.reroot())
+    assert len(tree.ordering()) == 4999
+
+
+def test_write_ordering(l7_graphs, tmp_path):
+    graph = l7_graphs[0]
+    ordering = list(graph.edges())
+    ct, _ = contract_fast(graph, ordering)
+
+    aggregator = data.ResultsAggregator()
+    aggregator.graph[graph.id] = graph
+    aggregator.name[graph.id] = graph.name
+    aggregator.ordering[graph.id] = ordering
+    aggregator._processed_ids.add(graph.id)
+
+    # a float Ct is checked to rounding, an integer one exactly
+    aggregator.ct[graph.id] = float(ct)
+    aggregator.write_ordering(tmp_path / "order.txt")
+    aggregator.ct[graph.id] = ct + 1
+    with pytest.raises(AssertionError):
+        aggregator.write_ordering(tmp_path / "order.txt")
+
+
+def test_parallel_ratcon(l7_graphs):
+    results = []
+    for workers in (1, 2):
+        random.seed(1)
+        ratcon_runner = data.RatconResultsAggregator('/tmp', 3, workers=workers)
+        for graph in l7_graphs[:2]:
+            ratcon_runner.run_graph(graph)
+
+        results.append((ratcon_runner.ct, ratcon_runner.ordering))
+
+    assert results[0] == results[1]
+
+
+def test_time_budget(l7_graphs, tmp_path):
+    # an exhausted budget still runs one carving per graph
+    ratcon_runner = data.RatconResultsAggregator(tmp_path, 5, time_budget=0, stream=True)
+    graphs = l7_graphs[:2]
+    for graph in graphs:
+        ratcon_runner.run_graph(graph)
+
+    assert all(len(results['Ct']) == 1 for results in ratcon_runner.piecemeal.values())
+
+    with open(ratcon_runner.piecemeal_results_file_best) as streamed:
+        assert len(streamed.readlines()) == 1 + len(graphs)